@@ -0,0 +1,61 @@
+import os
+import hashlib
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+# Persist this directory between runs (e.g. with actions/cache) to reuse results across PRs
+CACHE_DIR = Path(os.getenv('CORI_CACHE_DIR', Path.home() / '.cache' / 'cori-ai'))
+# Entries unused for this long are pruned, and each namespace keeps at most this many of the most recent
+CACHE_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+CACHE_MAX_ENTRIES = 5_000
+
+def cache_key(*parts: str) -> str:
+    """Hash the given parts into a stable, content-addressed cache key."""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        digest.update(part.encode('utf-8', errors='replace'))
+        digest.update(b'\0')  # Separator so ("ab", "c") and ("a", "bc") don't collide
+    return digest.hexdigest()
+
+def get_cached(namespace: str, key: str) -> Optional[str]:
+    """Get a cached value, or None if it's missing or unreadable."""
+    path = CACHE_DIR / namespace / key
+    try:
+        value = path.read_text(encoding='utf-8')
+    except OSError:
+        return None
+    try:
+        os.utime(path)  # Mark the entry as recently used so pruning keeps it
+    except OSError:
+        pass
+    return value
+
+def set_cached(namespace: str, key: str, value: str) -> None:
+    """Store a value atomically so concurrent runs never read a partial entry."""
+    directory = CACHE_DIR / namespace
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp_path, directory / key)
+    except OSError as e:
+        logging.warning(f"⚠️ Could not write cache entry {namespace}/{key}: {str(e)}")
+
+def prune_cache(namespace: str, max_age: float = CACHE_MAX_AGE_SECONDS, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+    """Remove entries of a namespace that are too old or beyond the newest `max_entries`."""
+    try:
+        entries = [(entry.stat().st_mtime, entry.path) for entry in os.scandir(CACHE_DIR / namespace) if entry.is_file()]
+    except OSError:
+        return
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age
+    for index, (mtime, path) in enumerate(entries):
+        if index >= max_entries or mtime < cutoff:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Another run may have removed or replaced it already
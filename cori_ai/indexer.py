@@ -1,67 +1,127 @@
 import os
-from typing import Dict, List, Optional
-from pathlib import Path
+import io
+from typing import Dict, List, Optional, Tuple
 import fnmatch
+import re
 from langchain.prompts import ChatPromptTemplate
 import asyncio
-import aiofiles
-from cori_ai.llm_client import LLMClient
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from cori_ai.llm_client import LLMClient, estimate_tokens
+from cori_ai.cache import cache_key, get_cached, set_cached
+
+# Key files beyond this size are cut off; the analysis only needs their overall shape
+MAX_FILE_BYTES = 256 * 1024
+
+def read_text_file(file_path: str, max_bytes: int = MAX_FILE_BYTES) -> str:
+    """Read up to max_bytes of a text file in one blocking call, replacing undecodable bytes."""
+    with open(file_path, 'rb') as f:
+        data = f.read(max_bytes + 1)
+    text = data[:max_bytes].decode('utf-8', errors='replace')
+    return text + "\n...[truncated]" if len(data) > max_bytes else text
+
+IGNORE_PATTERNS = [
+    '*.pyc', '__pycache__/*', '.git/*', '.github/*', 'node_modules/*',
+    '*.min.js', '*.min.css', '*.map', '*.lock', '*.sum',
+    'dist/*', 'build/*', '.env*', '*.log',
+    # Swift specific
+    '*.xcodeproj/*', '*.xcworkspace/*', 'Pods/*', '*.xcuserstate',
+    # Flutter specific
+    '.dart_tool/*', '.flutter-plugins', '.flutter-plugins-dependencies',
+    # Go specific
+    '*go.mod', 'go.sum',
+    # Android specific
+    'android/*', 'ios/*', 'ios/Pods/*', 'android/.gradle/*',
+    # Rust specific
+    'Cargo.lock', 'Cargo.toml', '*.rs', '*.toml', '*.lock', '*.lock',
+    # Kotlin specific
+    '*.kt', '*.kts', '*.gradle', '*.gradlew', '*.gradlew.bat', '*.gradle.kts',
+    # Java specific 
+    '*.java', '*.class', '*.jar', '*.war', '*.ear', '*.gradle', '*.gradlew', '*.gradlew.bat', '*.gradle.kts',
+    # C# specific
+    '*.cs', '*.dll', '*.exe', '*.pdb', '*.csproj', '*.sln', '*.config', '*.props', '*.targets', '*.nuspec', '*.nupkg', '*.csproj.user', '*.csproj.vspscc', '*.csproj.vssscc', '*.csproj.webinfo', '*.csproj.user', '*.csproj.vspscc', '*.csproj.vssscc', '*.csproj.webinfo',
+    # PHP specific
+    '*.php', '*.php3', '*.php4', '*.php5', '*.php7', '*.phps', '*.phpt', '*.phtml', '*.inc', '*.module', '*.profile', '*.engine', '*.engine.php', '*.engine.inc', '*.engine.module', '*.engine.profile', '*.engine.inc', '*.engine.module', '*.engine.profile',
+]
+
+# All ignore globs fused into one regex, so each path is matched in a single pass
+IGNORE_RE = re.compile("|".join(fnmatch.translate(pattern) for pattern in dict.fromkeys(IGNORE_PATTERNS)))
+
+# Globs ending in '*' keep matching whatever follows, so a directory matching one can be skipped whole
+DIR_IGNORE_RE = re.compile("|".join(
+    fnmatch.translate(pattern) for pattern in dict.fromkeys(IGNORE_PATTERNS) if pattern.endswith('*')
+))
+
+# Dependency and tool caches that can sit at any depth (e.g. packages/app/node_modules), which
+# the root-anchored globs above don't catch
+SKIP_DIR_NAMES = {
+    'node_modules', '__pycache__', '.git', 'venv', '.venv', '.tox', '.mypy_cache', '.pytest_cache',
+    '.dart_tool', 'Pods',
+}
+
+# Directory listings are latency bound, so several are kept in flight at once
+INDEX_WORKERS = 16
+
+# Files listed per type in the analysis prompt; past this the paths add tokens, not structure
+INDEX_SUMMARY_MAX_FILES = 500
+
+# Tokens kept free of project content for the analysis prompt template and the response
+ANALYSIS_RESERVED_TOKENS = 4000
 
 def should_ignore_file(file_path: str) -> bool:
     """Check if file should be ignored in indexing."""
-    ignore_patterns = [
-        '*.pyc', '__pycache__/*', '.git/*', '.github/*', 'node_modules/*',
-        '*.min.js', '*.min.css', '*.map', '*.lock', '*.sum',
-        'dist/*', 'build/*', '.env*', '*.log',
-        # Swift specific
-        '*.xcodeproj/*', '*.xcworkspace/*', 'Pods/*', '*.xcuserstate',
-        # Flutter specific
-        '.dart_tool/*', '.flutter-plugins', '.flutter-plugins-dependencies',
-        # Go specific
-        '*go.mod', 'go.sum',
-        # Android specific
-        'android/*', 'ios/*', 'ios/Pods/*', 'android/.gradle/*',
-        # Rust specific
-        'Cargo.lock', 'Cargo.toml', '*.rs', '*.toml', '*.lock', '*.lock',
-        # Kotlin specific
-        '*.kt', '*.kts', '*.gradle', '*.gradlew', '*.gradlew.bat', '*.gradle.kts',
-        # Java specific 
-        '*.java', '*.class', '*.jar', '*.war', '*.ear', '*.gradle', '*.gradlew', '*.gradlew.bat', '*.gradle.kts',
-        # C# specific
-        '*.cs', '*.dll', '*.exe', '*.pdb', '*.csproj', '*.sln', '*.config', '*.props', '*.targets', '*.nuspec', '*.nupkg', '*.csproj.user', '*.csproj.vspscc', '*.csproj.vssscc', '*.csproj.webinfo', '*.csproj.user', '*.csproj.vspscc', '*.csproj.vssscc', '*.csproj.webinfo',
-        # PHP specific
-        '*.php', '*.php3', '*.php4', '*.php5', '*.php7', '*.phps', '*.phpt', '*.phtml', '*.inc', '*.module', '*.profile', '*.engine', '*.engine.php', '*.engine.inc', '*.engine.module', '*.engine.profile', '*.engine.inc', '*.engine.module', '*.engine.profile',
-    ]
-    return any(fnmatch.fnmatch(file_path, pattern) for pattern in ignore_patterns)
+    return IGNORE_RE.match(file_path) is not None
+
+FILE_TYPE_EXTENSIONS = {
+    'source': ['.py', '.js', '.ts', '.java', '.cpp', '.go', '.rs', '.swift', '.dart', '.flutter'],
+    'documentation': ['.md', '.txt', '.rst', '.markdown'],
+    'config': ['.json', '.yaml', '.yml', '.toml'],
+    'frontend': ['.html', '.css', '.scss', '.less', '.vue', '.svelte', '.astro', '.jsx', '.tsx'],
+    'data': ['.sql', '.graphql'],
+    'test': ['.test.js', '.test.ts', '.spec.py', '_test.go', '.spec.js', '.spec.ts', '.test.dart', '.test.swift', '.test.py', '.test.java', '.test.cpp', '.test.go', '.test.rs', '.test.swift', '.test.dart', '.test.flutter'],
+    'environment': ['.env', '.env.*', '.env.local', '.env.development', '.env.production', '.env.staging', '.env.test', '.env.development.local', '.env.production.local', '.env.staging.local', '.env.test.local'],
+    'ignore': ['.gitignore', '.dockerignore'],
+    'git': ['.git', '.github'],
+    'github': ['.github'],
+    'docker': ['.dockerfile', '.dockerignore', '.docker-compose.yml', '.docker-compose.yaml', '.docker-compose.toml'],
+    'npm': ['.npmrc', '.yarnrc', '.yarnrc.yml', '.yarnrc.yaml', '.yarnrc.json', '.yarnrc.toml', '.yarnrc.yaml', '.yarnrc.yml'],
+}
+
+# Inverted once so classifying a file is a single dict lookup; earlier categories win on overlap
+EXTENSION_TO_TYPE: Dict[str, str] = {}
+for _file_type, _extensions in FILE_TYPE_EXTENSIONS.items():
+    for _extension in _extensions:
+        EXTENSION_TO_TYPE.setdefault(_extension, _file_type)
+
+# Compound suffixes (e.g. '.test.js') that splitext would reduce to their last part
+TEST_SUFFIXES = tuple(dict.fromkeys(FILE_TYPE_EXTENSIONS['test']))
 
 def get_file_type(file_path: str) -> Optional[str]:
     """Get the type of file based on extension and content."""
-    ext = Path(file_path).suffix.lower()
-    if ext in ['.py', '.js', '.ts', '.java', '.cpp', '.go', '.rs', '.swift', '.dart', '.flutter']:
-        return 'source'
-    elif ext in ['.md', '.txt', '.rst', '.markdown']:
-        return 'documentation'
-    elif ext in ['.json', '.yaml', '.yml', '.toml']:
-        return 'config'
-    elif ext in ['.html', '.css', '.scss', '.less', '.vue', '.svelte', '.astro', '.jsx', '.tsx']:
-        return 'frontend'
-    elif ext in ['.sql', '.graphql']:
-        return 'data'
-    elif ext in ['.test.js', '.test.ts', '.spec.py', '_test.go', '.spec.js', '.spec.ts', '.test.dart', '.test.swift', '.test.py', '.test.java', '.test.cpp', '.test.go', '.test.rs', '.test.swift', '.test.dart', '.test.flutter']:
+    file_path = file_path.lower()
+    if file_path.endswith(TEST_SUFFIXES):
         return 'test'
-    elif ext in ['.env', '.env.*', '.env.local', '.env.development', '.env.production', '.env.staging', '.env.test', '.env.development.local', '.env.production.local', '.env.staging.local', '.env.test.local']:
-        return 'environment'
-    elif ext in ['.gitignore', '.dockerignore']:
-        return 'ignore'
-    elif ext in ['.git', '.github']:
-        return 'git'
-    elif ext in ['.github']:
-        return 'github'
-    elif ext in ['.dockerfile', '.dockerignore', '.docker-compose.yml', '.docker-compose.yaml', '.docker-compose.toml']:
-        return 'docker'
-    elif ext in ['.npmrc', '.yarnrc', '.yarnrc.yml', '.yarnrc.yaml', '.yarnrc.json', '.yarnrc.toml', '.yarnrc.yaml', '.yarnrc.yml']:
-        return 'npm'
-    return None
+    return EXTENSION_TO_TYPE.get(os.path.splitext(file_path)[1])
+
+def scan_directory(root_dir: str, rel_dir: str) -> Tuple[List[str], List[str]]:
+    """List one directory, returning its files and the subdirectories worth descending into."""
+    files: List[str] = []
+    subdirs: List[str] = []
+    try:
+        entries = list(os.scandir(os.path.join(root_dir, rel_dir)))
+    except OSError:
+        return files, subdirs
+
+    for entry in entries:
+        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+        if entry.is_dir():
+            # Like os.walk, don't follow symlinked directories; skip ignored subtrees entirely
+            if (not entry.is_symlink() and entry.name not in SKIP_DIR_NAMES
+                    and not DIR_IGNORE_RE.match(rel_path + os.sep)):
+                subdirs.append(rel_path)
+        else:
+            files.append(rel_path)
+
+    return files, subdirs
 
 def index_codebase(root_dir: str) -> Dict[str, List[str]]:
     """Create an index of the codebase organized by file type."""
@@ -75,27 +135,59 @@ def index_codebase(root_dir: str) -> Dict[str, List[str]]:
         'other': []
     }
     
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            rel_path = os.path.relpath(file_path, root_dir)
-            
-            if should_ignore_file(rel_path):
-                print(f"Ignoring file: {file} because it matches ignore patterns.")
-                continue
-                
-            file_type = get_file_type(rel_path) or 'other'
-            index[file_type].append(rel_path)
+    # Scan directories on a thread pool with scandir (entry types come from the listing and
+    # ignored subtrees are pruned); results are classified here as each listing completes
+    with ThreadPoolExecutor(max_workers=INDEX_WORKERS) as executor:
+        pending = {executor.submit(scan_directory, root_dir, '')}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                pending.update(executor.submit(scan_directory, root_dir, subdir) for subdir in subdirs)
+
+                for rel_path in files:
+                    if should_ignore_file(rel_path):
+                        continue
+
+                    file_type = get_file_type(rel_path)
+                    # Types without an index section (e.g. 'docker') are listed with the rest
+                    index[file_type if file_type in index else 'other'].append(rel_path)
     
     return index
 
-async def analyze_project_structure(index: Dict[str, List[str]], repo_root: str) -> str:
-    """Generate a high-level analysis of the project structure."""
-    llm_client = LLMClient()
-    llm = llm_client.get_client()
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are a technical architect analyzing a codebase structure.
+# Markup that costs tokens without telling the model anything about the project
+HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+MARKDOWN_IMAGE_LINE_RE = re.compile(r'^[ \t]*(?:\[?!\[[^\]]*\]\([^)]*\)\]?(?:\([^)]*\))?[ \t]*)+$', re.MULTILINE)
+TRAILING_SPACE_RE = re.compile(r'[ \t]+$', re.MULTILINE)
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+def compress_text(text: str) -> str:
+    """Drop HTML comments, image/badge lines and redundant whitespace from a text."""
+    text = HTML_COMMENT_RE.sub('', text)
+    text = MARKDOWN_IMAGE_LINE_RE.sub('', text)
+    text = TRAILING_SPACE_RE.sub('', text)
+    return BLANK_LINES_RE.sub('\n\n', text)
+
+def fit_to_token_budget(sections: List[str], budget: int) -> List[str]:
+    """Compress, then truncate the largest sections first until their estimated total fits the token budget."""
+    fitted = list(sections)
+    excess = sum(estimate_tokens(section) for section in fitted) - budget
+    if excess > 0:
+        # Lossless-for-the-model compression first, so truncation only cuts what's left over
+        fitted = [compress_text(section) for section in fitted]
+        excess = sum(estimate_tokens(section) for section in fitted) - budget
+    for i in sorted(range(len(fitted)), key=lambda i: len(fitted[i]), reverse=True):
+        if excess <= 0:
+            break
+        tokens = estimate_tokens(fitted[i])
+        keep = max(0, tokens - excess)
+        fitted[i] = fitted[i][:keep * 4] + "\n...[truncated]"
+        excess -= tokens - keep
+    return fitted
+
+# Built once at import; only the index summary and key files vary between calls
+ANALYSIS_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a technical architect analyzing a codebase structure.
 Create a concise but comprehensive overview of the project structure and guidelines.
 Focus on:
 1. Project organization and architecture
@@ -115,55 +207,93 @@ Steps:
 Do not use any other language than English. Do not leak any sensitive information.
 
 Keep the response focused and actionable for code review purposes."""),
-        ("human", """Here's the codebase structure:
+    ("human", """Here's the codebase structure:
 
 {index_summary}
 
 Key files content:
 {key_files_content}
 """)
-    ])
-    
+])
+
+async def analyze_project_structure(index: Dict[str, List[str]], repo_root: str) -> str:
+    """Generate a high-level analysis of the project structure."""
     # Read content of key files asynchronously
-    key_files = []
     tasks = []
     key_file_paths = [os.path.join(repo_root, 'README.md'), os.path.join(repo_root, '.editorconfig')]
     
     async def read_file(file_path: str):
         if os.path.exists(file_path):
-            async with aiofiles.open(file_path, 'r') as f:
-                content = await f.read()
-                key_files.append((os.path.basename(file_path), content))
+            # One thread hop per file instead of aiofiles' separate open/read/close hops
+            content = await asyncio.to_thread(read_text_file, file_path)
+            return os.path.basename(file_path), content
+        return None
     
     for file_path in key_file_paths:
         tasks.append(read_file(file_path))
     
-    await asyncio.gather(*tasks)
+    # gather keeps input order, so the prompt (and its cache key) is stable across runs
+    key_files = [key_file for key_file in await asyncio.gather(*tasks) if key_file]
     
-    # Format index summary
-    index_summary = []
+    # Write the summary and key files straight into buffers as they are formatted, rather than
+    # building a list of pieces and joining it (which briefly holds both copies in memory)
+    index_summary = io.StringIO()
     for file_type, files in index.items():
         if files:
-            index_summary.append(f"\n{file_type.upper()} FILES:")
-            for file in sorted(files):
-                index_summary.append(f"- {file}")
+            if index_summary.tell():
+                index_summary.write("\n")
+            index_summary.write(f"\n{file_type.upper()} FILES:")
+            listed = sorted(files)[:INDEX_SUMMARY_MAX_FILES]
+            index_summary.writelines(f"\n- {file}" for file in listed)
+            if len(files) > len(listed):
+                index_summary.write(f"\n- ... and {len(files) - len(listed)} more")
     
-    # Format key files content
-    key_files_content = []
+    key_files_content = io.StringIO()
     for filename, content in key_files:
-        key_files_content.append(f"\n=== {filename} ===\n{content}")
+        if key_files_content.tell():
+            key_files_content.write("\n")
+        key_files_content.write(f"\n=== {filename} ===\n{content}")
     
-    response = llm.invoke(prompt.format(
-        index_summary="\n".join(index_summary),
-        key_files_content="\n".join(key_files_content)
-    ))
+    # Only trim when the content can't fit the model's context window, largest section first
+    llm_client = LLMClient()
+    budget = llm_client.get_token_limit('fast') - ANALYSIS_RESERVED_TOKENS
+    index_summary_text, key_files_text = fit_to_token_budget(
+        [index_summary.getvalue(), key_files_content.getvalue()], budget
+    )
     
+    # Keep the static system message as its own leading message so providers with automatic
+    # prefix caching (e.g. OpenAI) can reuse it; only the human message varies between repos
+    messages = ANALYSIS_PROMPT.format_messages(
+        index_summary=index_summary_text,
+        key_files_content=key_files_text
+    )
+
+    # The analysis only depends on the prompt and model, so unchanged trees reuse the last result
+    key = cache_key(*llm_client.get_cache_key_parts('fast'), *(message.content for message in messages))
+    cached = get_cached('analysis', key)
+    if cached is not None:
+        return cached
+
+    # Summarizing the tree is light work, so it runs on the fast model tier
+    llm = llm_client.get_client('fast')
+    # Await the async call so the event loop isn't blocked for the whole LLM round-trip
+    response = await llm.ainvoke(messages)
+    set_cached('analysis', key, response.content)
+
     return response.content
 
+async def analyze_codebase(repo_root: str) -> str:
+    """Index the codebase without blocking the event loop, then analyze its structure."""
+    try:
+        index = await asyncio.get_running_loop().run_in_executor(None, index_codebase, repo_root)
+        return await analyze_project_structure(index, repo_root)
+    finally:
+        # The async HTTP client can't outlive this event loop, which asyncio.run closes on return
+        await LLMClient.aclose_http_async_client()
+
 def generate_review_context(repo_root: str) -> str:
     """Generate the complete context for code review."""
-    index = index_codebase(repo_root)
-    analysis = asyncio.run(analyze_project_structure(index, repo_root))
+    analysis = asyncio.run(analyze_codebase(repo_root))
     
     return f"""PROJECT CONTEXT AND GUIDELINES
 
@@ -1,92 +1,289 @@
 import os
-from typing import Optional
+import atexit
+import functools
+import importlib
+from typing import Dict, Optional, Tuple, Type
 import httpx
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain_mistralai.chat_models import ChatMistralAI
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.language_models.chat_models import BaseChatModel
 import logging
+import threading
+
+# Settings that change which model a provider builds; clients are cached per model and combination of these
+PROVIDER_SETTINGS = {
+    'openai': ('INPUT_OPENAI_API_KEY', 'INPUT_OPENAI_BASE_URL'),
+    'gemini': ('INPUT_GOOGLE_API_KEY',),
+    'groq': ('INPUT_GROQ_API_KEY',),
+    'mistral': ('INPUT_MISTRAL_API_KEY',),
+    'ollama': ('INPUT_OLLAMA_BASE_URL', 'INPUT_OLLAMA_API_KEY'),
+}
+
+# API endpoint of the providers whose base URL can be configured, and its default
+BASE_URL_SETTINGS = {
+    'openai': ('INPUT_OPENAI_BASE_URL', 'https://api.openai.com/v1'),
+    'ollama': ('INPUT_OLLAMA_BASE_URL', 'http://localhost:11434'),
+}
+
+# Model tiers: 'smart' does the code review, 'fast' the lighter summarization work
+# (project analysis, PR summaries) and uses INPUT_FAST_MODEL when it's set
+MODEL_TIERS = ('smart', 'fast')
+
+# Chat model class of each provider as (module, class). Provider SDKs each take around a second
+# to import, so only the configured one is loaded, on first use
+CHAT_MODEL_CLASSES = {
+    'openai': ('langchain_openai', 'ChatOpenAI'),
+    'gemini': ('langchain_google_genai', 'ChatGoogleGenerativeAI'),
+    'groq': ('langchain_groq', 'ChatGroq'),
+    'mistral': ('langchain_mistralai.chat_models', 'ChatMistralAI'),
+    'ollama': ('langchain_ollama', 'ChatOllama'),
+}
+
+@functools.lru_cache(maxsize=None)
+def load_chat_model_class(provider: str) -> Type[BaseChatModel]:
+    """Import and return the chat model class of a provider."""
+    module_name, class_name = CHAT_MODEL_CLASSES[provider]
+    return getattr(importlib.import_module(module_name), class_name)
+
+@functools.lru_cache(maxsize=None)
+def resolve_provider(provider: str) -> str:
+    """Map a configured provider name to a supported one; cached so an unknown name is reported once."""
+    if provider not in PROVIDER_SETTINGS:
+        logging.warning(f"Unsupported provider: {provider}, falling back to OpenAI")
+        return 'openai'
+    return provider
+
+# Model used for each provider when INPUT_MODEL isn't set
+DEFAULT_MODELS = {
+    'openai': 'gpt-4o-mini',
+    'gemini': 'gemini-1.5-flash',
+    'groq': 'mixtral-8x7b-32768',
+    'mistral': 'mistral-large-latest',
+    'ollama': 'codellama:7b',
+}
+
+# Context window sizes by model name prefix; the longest matching prefix wins
+MODEL_TOKEN_LIMITS = {
+    'gpt-4o': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'gemini-1.5': 1000000,
+    'mixtral-8x7b': 32768,
+    'llama-3.1': 128000,
+    'llama3': 8192,
+    'mistral-large': 128000,
+    'mistral-medium': 32000,
+    'mistral-small': 32000,
+    'codellama': 16384,
+}
+DEFAULT_TOKEN_LIMIT = 8192
+# Longest prefixes first, so the first match is the most specific one
+MODEL_TOKEN_PREFIXES = sorted(MODEL_TOKEN_LIMITS, key=len, reverse=True)
+
+@functools.lru_cache(maxsize=32)
+def get_token_limit(model: str) -> int:
+    """Get the context window of a model from its longest matching name prefix."""
+    for prefix in MODEL_TOKEN_PREFIXES:
+        if model.startswith(prefix):
+            return MODEL_TOKEN_LIMITS[prefix]
+    return DEFAULT_TOKEN_LIMIT
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+# One keep-alive pool per client kind shared by every model, sized for concurrent review calls. Idle
+# connections are kept for a minute (httpx drops them after 5s) so the ones pre-warmed while the
+# codebase is analyzed are still open when the review calls start
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0)
+
+# API hosts of the providers that use the shared HTTP clients, for pre-warming their connections
+PREWARM_URLS = {
+    'openai': 'https://api.openai.com/v1',
+    'groq': 'https://api.groq.com',
+}
+PREWARM_TIMEOUT = 5.0
 
 class LLMClient:
     _instance = None
-    _client: Optional[BaseChatModel] = None
+    _clients: Dict[Tuple[Optional[str], ...], BaseChatModel] = {}
+    _http_client: Optional[httpx.Client] = None
+    _http_async_client: Optional[httpx.AsyncClient] = None
+    # First use can come from several threads at once (context generation, pre-warming, the review),
+    # so every lazy creation is double-checked under this lock; reentrant since models create the HTTP clients
+    _lock = threading.RLock()
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(LLMClient, cls).__new__(cls)
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(LLMClient, cls).__new__(cls)
         return cls._instance
 
-    def _init_openai(self) -> BaseChatModel:
+    @classmethod
+    def _get_http_client(cls) -> httpx.Client:
+        """Get the shared HTTP client used by invoke/batch, so models reuse warm connections."""
+        if cls._http_client is None:
+            with cls._lock:
+                if cls._http_client is None:
+                    cls._http_client = httpx.Client(timeout=60.0, limits=HTTP_LIMITS)
+                    atexit.register(cls._http_client.close)
+        return cls._http_client
+
+    @classmethod
+    def _get_http_async_client(cls) -> httpx.AsyncClient:
+        """Get the shared async HTTP client, so models reuse one keep-alive connection pool."""
+        if cls._http_async_client is None:
+            with cls._lock:
+                if cls._http_async_client is None:
+                    cls._http_async_client = httpx.AsyncClient(timeout=60.0, limits=HTTP_LIMITS)
+        return cls._http_async_client
+
+    @classmethod
+    async def aclose_http_async_client(cls) -> None:
+        """Close the async HTTP client before the event loop it was used on ends.
+
+        httpx binds pooled connections to their event loop, so a later asyncio.run gets a new client,
+        and new models since the cached ones hold the closed client.
+        """
+        with cls._lock:
+            http_async_client, cls._http_async_client = cls._http_async_client, None
+            if http_async_client is None:
+                return
+            for key, client in list(cls._clients.items()):
+                if getattr(client, 'http_async_client', None) is http_async_client:
+                    del cls._clients[key]
+        await http_async_client.aclose()
+
+    def prewarm(self, connections: int) -> None:
+        """Open keep-alive connections to the provider's API ahead of the first LLM calls."""
+        provider = self._get_provider()
+        if provider not in PREWARM_URLS:
+            return
+        url = (provider == 'openai' and os.getenv('INPUT_OPENAI_BASE_URL')) or PREWARM_URLS[provider]
+        http_client = self._get_http_client()
+
+        def open_connection(_):
+            # Any response (even a 401 or 404) leaves a TLS connection in the pool
+            try:
+                http_client.head(url, timeout=PREWARM_TIMEOUT)
+            except httpx.HTTPError as e:
+                logging.debug(f"Could not pre-warm a connection to {url}: {str(e)}")
+
+        # Concurrent requests, so each one opens its own connection; more than the pool keeps would be dropped
+        connections = min(connections, HTTP_LIMITS.max_connections)
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix='prewarm') as executor:
+            list(executor.map(open_connection, range(connections)))
+
+    def _init_openai(self, model: str) -> BaseChatModel:
         """Initialize OpenAI client."""
-        return ChatOpenAI(
-            model_name=os.getenv('INPUT_MODEL', 'gpt-4o-mini'),
+        return load_chat_model_class('openai')(
+            model_name=model,
             api_key=os.getenv('INPUT_OPENAI_API_KEY'),
-            http_async_client=httpx.AsyncClient(timeout=60.0),
-            base_url=os.getenv('INPUT_OPENAI_BASE_URL', 'https://api.openai.com/v1'),
+            http_client=self._get_http_client(),
+            http_async_client=self._get_http_async_client(),
+            base_url=self.get_base_url(),
             temperature=0.1
         )
 
-    def _init_gemini(self) -> BaseChatModel:
+    def _init_gemini(self, model: str) -> BaseChatModel:
         """Initialize Google Gemini client."""
-        return ChatGoogleGenerativeAI(
-            model=os.getenv('INPUT_MODEL', 'gemini-1.5-flash'),
+        return load_chat_model_class('gemini')(
+            model=model,
             api_key=os.getenv('INPUT_GOOGLE_API_KEY'),
             temperature=0.1
         )
 
-    def _init_groq(self) -> BaseChatModel:
+    def _init_groq(self, model: str) -> BaseChatModel:
         """Initialize Groq client."""
-        return ChatGroq(
+        return load_chat_model_class('groq')(
             api_key=os.getenv('INPUT_GROQ_API_KEY'),
-            model_name=os.getenv('INPUT_MODEL', 'mixtral-8x7b-32768'),
+            model_name=model,
+            http_client=self._get_http_client(),
+            http_async_client=self._get_http_async_client(),
             temperature=0.1
         )
 
-    def _init_mistral(self) -> BaseChatModel:
+    def _init_mistral(self, model: str) -> BaseChatModel:
         """Initialize Mistral client."""
-        return ChatMistralAI(
+        return load_chat_model_class('mistral')(
             api_key=os.getenv('INPUT_MISTRAL_API_KEY'),
-            model_name=os.getenv('INPUT_MODEL', 'mistral-large-latest'),
+            model_name=model,
             temperature=0.1
         )
         
-    def _init_ollama(self) -> BaseChatModel:
+    def _init_ollama(self, model: str) -> BaseChatModel:
         """Initialize Ollama client."""
-        return ChatOllama(
-            model=os.getenv('INPUT_MODEL', 'codellama:7b'),
-            base_url=os.getenv('INPUT_OLLAMA_BASE_URL', 'http://localhost:11434'),
+        return load_chat_model_class('ollama')(
+            model=model,
+            base_url=self.get_base_url(),
             api_key=os.getenv('INPUT_OLLAMA_API_KEY'),
             temperature=0.1
         )
 
-    def get_client(self) -> BaseChatModel:
-        """Get LLM client based on provider."""
-        if self._client is not None:
-            return self._client
-
-        provider = os.getenv('INPUT_PROVIDER', 'openai').lower()
-        try:
-            if provider == 'openai':
-                self._client = self._init_openai()
-            elif provider == 'gemini':
-                self._client = self._init_gemini()
-            elif provider == 'groq':
-                self._client = self._init_groq()
-            elif provider == 'mistral':
-                self._client = self._init_mistral()
-            elif provider == 'ollama':
-                self._client = self._init_ollama()
-            else:
-                logging.error(f"Unsupported provider: {provider}, falling back to OpenAI")
-                self._client = self._init_openai()
-        except Exception as e:
-            logging.error(f"Error initializing {provider} client: {str(e)}")
-            raise
-
-        return self._client
+    def _get_provider(self) -> str:
+        """Get the configured provider, falling back to OpenAI for unknown ones."""
+        return resolve_provider(os.getenv('INPUT_PROVIDER', 'openai').lower())
+
+    def get_model(self, tier: str = 'smart') -> str:
+        """Get the model name configured for a tier."""
+        if tier not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier: {tier}")
+        model = os.getenv('INPUT_MODEL') or DEFAULT_MODELS[self._get_provider()]
+        if tier == 'fast':
+            return os.getenv('INPUT_FAST_MODEL') or model
+        return model
+
+    def get_base_url(self) -> str:
+        """Get the API endpoint the provider is called at, or '' for providers with a fixed one."""
+        provider = self._get_provider()
+        if provider not in BASE_URL_SETTINGS:
+            return ''
+        name, default = BASE_URL_SETTINGS[provider]
+        return os.getenv(name) or default
+
+    def get_cache_key_parts(self, tier: str = 'smart') -> Tuple[str, str, str]:
+        """Get what identifies the model answering for a tier, for keying cached responses."""
+        return self._get_provider(), self.get_model(tier), self.get_base_url()
+
+    def get_token_limit(self, tier: str = 'smart') -> int:
+        """Get the context window of the model configured for a tier."""
+        return get_token_limit(self.get_model(tier))
+
+    def get_client(self, tier: str = 'smart') -> BaseChatModel:
+        """Get LLM client based on provider and model tier."""
+        provider = self._get_provider()
+        model = self.get_model(tier)
+
+        # Reuse the model built for the same provider settings instead of constructing a new one
+        key = (provider, model, *(os.getenv(name) for name in PROVIDER_SETTINGS[provider]))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+
+            try:
+                if provider == 'openai':
+                    client = self._init_openai(model)
+                elif provider == 'gemini':
+                    client = self._init_gemini(model)
+                elif provider == 'groq':
+                    client = self._init_groq(model)
+                elif provider == 'mistral':
+                    client = self._init_mistral(model)
+                elif provider == 'ollama':
+                    client = self._init_ollama(model)
+            except Exception as e:
+                logging.error(f"Error initializing {provider} client: {str(e)}")
+                raise
+
+            self._clients[key] = client
+        return client
 
     def reset_client(self):
         """Reset the LLM client."""
-        self._client = None
\ No newline at end of file
+        self._clients.clear()
@@ -1,21 +1,40 @@
 import os
-from typing import List, Dict, Any, Optional, Tuple
-from github import Github, PullRequest, PullRequestComment, Repository
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from github import Github, GithubException, GithubRetry, PullRequest, PullRequestComment, Repository
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, ValidationError
 from cori_ai.indexer import generate_review_context
 from dotenv import load_dotenv
-from cori_ai.llm_client import LLMClient  # Import the singleton client
+from cori_ai.llm_client import LLMClient, estimate_tokens  # Import the singleton client
+from cori_ai.cache import cache_key, get_cached, set_cached, prune_cache
 import re
-import threading
-import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import logging
 
 load_dotenv()
 
-lock = threading.Lock()
+# Matches a unified diff hunk header and captures the starting line in the new file
+HUNK_HEADER_RE = re.compile(r'@@ -\d+,?\d* \+(\d+),?\d* @@')
+
+# Rate-limited and transient GitHub errors are retried by PyGithub this many times
+GITHUB_MAX_RETRIES = 3
+# Connections kept in each GitHub client's pool
+GITHUB_CONCURRENCY = 8
+# Body of the review each group's comments are posted in; GitHub requires one for COMMENT reviews
+REVIEW_BODY = "🦦 CoriAI review comments"
+# Default max number of file groups reviewed by the LLM at the same time (INPUT_REVIEW_CONCURRENCY)
+REVIEW_CONCURRENCY = 8
+# Small files are reviewed together, up to this many files / patch characters per LLM call;
+# larger patches are split on hunk boundaries into windows of at most REVIEW_BATCH_MAX_CHARS
+REVIEW_BATCH_MAX_FILES = 4
+REVIEW_BATCH_MAX_CHARS = 30_000
+# Share of the model's context window a review prompt may fill; the rest is left for the response.
+# Smaller models get proportionally smaller windows, down to REVIEW_MIN_WINDOW_CHARS
+REVIEW_PROMPT_CONTEXT_SHARE = 0.8
+REVIEW_MIN_WINDOW_CHARS = 2_000
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,177 +44,162 @@ class CodeReviewComment(BaseModel):
     line: int = Field(description="Line number in the file where the comment should be added", gt=0)
     body: Optional[str] = Field(description="The review comment with emoji category and specific feedback", default="")
 
-    @field_validator('line')
-    def line_must_be_positive(cls, v):
-        if v <= 0:
-            raise ValueError('Line number must be positive')
-        return v
-
 class CodeReviewResponse(BaseModel):
     comments: List[CodeReviewComment] = Field(description="New comments to add")
     comments_to_delete: List[int] = Field(description="IDs of comments that should be deleted", default=[])
 
-def validate_comment_position(file_patch: str, line: int) -> bool:
-    """Validate if a line number is valid for commenting."""
-    if not file_patch:
-        return False
-        
+REVIEW_PARSER = PydanticOutputParser(pydantic_object=CodeReviewResponse)
+# Rendering the instructions serializes the whole JSON schema, so do it once rather than per file
+REVIEW_FORMAT_INSTRUCTIONS = REVIEW_PARSER.get_format_instructions()
+# Matches a fenced ```json block so its body can be validated directly. Greedy up to the last fence,
+# since comment bodies can contain fenced code snippets of their own
+CODE_FENCE_RE = re.compile(r'```(?:json)?\s*(.*)```', re.DOTALL)
+
+def parse_review_response(text: str) -> CodeReviewResponse:
+    """Parse an LLM review response with the model's compiled validator in a single pass."""
+    match = CODE_FENCE_RE.search(text)
+    try:
+        return CodeReviewResponse.model_validate_json(match.group(1) if match else text)
+    except ValidationError:
+        # Fall back to LangChain's lenient parser for partial or loosely formatted JSON
+        return REVIEW_PARSER.parse(text)
+
+def iter_patch_lines(patch: str) -> Iterator[str]:
+    """Yield the lines of a patch one at a time, matching `patch.split('\\n')` without building the list."""
+    start = 0
+    while True:
+        end = patch.find('\n', start)
+        if end == -1:
+            yield patch[start:]
+            return
+        yield patch[start:end]
+        start = end + 1
+
+def iter_new_file_lines(patch: str) -> Iterator[Tuple[int, int]]:
+    """Yield (line number in the new file, position in the diff) for each hunk line that isn't removed.
+
+    Lines are classified by their first character in place; only hunk headers are matched, so no
+    per-line strings are created.
+    """
     current_line = 0
+    position = 0
     hunk_start = False
-    
-    for patch_line in file_patch.split('\n'):
-        if patch_line.startswith('@@'):
+    start = 0
+    length = len(patch)
+
+    while start <= length:
+        end = patch.find('\n', start)
+        if end == -1:
+            end = length
+        position += 1
+        first = patch[start] if start < end else ''
+        if first == '@' and patch.startswith('@@', start):
             hunk_start = True
-            match = re.search(r'@@ -\d+,?\d* \+(\d+),?\d* @@', patch_line)
+            match = HUNK_HEADER_RE.match(patch, start, end)
             if match:
                 current_line = int(match.group(1)) - 1
-            continue
-        
-        if hunk_start and not patch_line.startswith('-'):
+        elif first != '-' and hunk_start:
             current_line += 1
-            if current_line == line:
-                return True
-    
-    return False
+            yield current_line, position
+        start = end + 1
+
+def validate_comment_position(file_patch: str, line: int) -> bool:
+    """Validate if a line number is valid for commenting."""
+    if not file_patch:
+        return False
 
-def parse_patch_for_positions(patch: str) -> Dict[int, Dict[str, Any]]:
-    """Parse the patch to get line numbers and their positions in the diff."""
+    return any(current_line == line for current_line, _ in iter_new_file_lines(file_patch))
+
+def parse_patch_for_positions(patch: str) -> Dict[int, str]:
+    """Parse the patch to map each commentable line number in the new file to its diff line."""
     line_mapping = {}
-    current_position = 0
     current_line = 0
     hunk_start = False
     
     if not patch:
         return line_mapping
         
-    for line in patch.split('\n'):
-        current_position += 1
+    for line in iter_patch_lines(patch):
+        # Removed lines don't exist in the new file
+        if line[:1] == '-':
+            continue
         if line.startswith('@@'):
             hunk_start = True
-            match = re.search(r'@@ -\d+,?\d* \+(\d+),?\d* @@', line)
+            match = HUNK_HEADER_RE.match(line)
             if match:
                 current_line = int(match.group(1)) - 1
             continue
         
-        if hunk_start and not line.startswith('-'):
+        if hunk_start:
             current_line += 1
             if current_line > 0:  # Ensure we only map positive line numbers
-                line_mapping[current_line] = {
-                    'line': current_line,  # The actual line number in the file
-                    'content': line,
-                    'type': '+' if line.startswith('+') else ' ',
-                    'hunk': line
-                }
+                line_mapping[current_line] = line
     
     return line_mapping
 
-def verify_comment_position(llm: ChatOpenAI, file_path: str, line: int, patch: str) -> bool:
-    """Use LLM to verify if a comment position is valid."""
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """Verify if the given line number is valid for commenting in the diff.
-        Rules:
-        1. Line must be part of the diff (in a hunk)
-        2. Line must be in the new/modified code (not removed lines)
-        3. Line number must be positive
-        4. Line must exist in the new version
-        
-        Return ONLY 'true' or 'false'"""),
-        ("human", """File: {file}
-        Line number: {line}
-        
-        Diff:
-        {patch}""")
-    ])
-    
-    try:
-        result = llm.invoke(prompt.format(
-            file=file_path,
-            line=line,
-            patch=patch
-        ))
-        return result.content.strip().lower() == 'true'
-    except Exception:
-        return False
-
-def get_file_content(repo, file_path: str, commit_sha: str) -> str:
-    """Get the content of a file at a specific commit."""
-    try:
-        content = repo.get_contents(file_path, ref=commit_sha)
-        return content.decoded_content.decode('utf-8')
-    except Exception:
-        return ""
-
 def get_pr_diff(repo: Repository.Repository, pr: PullRequest.PullRequest) -> List[Dict[str, Any]]:
-    """Get the PR diff from GitHub."""
+    """Get the PR diff from GitHub: each changed file's patch, commentable lines and existing comments."""
+    # Listing the files and fetching the review comments are independent round-trips, so they overlap
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='gh') as executor:
+        files_future = executor.submit(lambda: list(pr.get_files()))
+        comments_by_path = get_existing_comments(pr)
+        files = files_future.result()
+
     return [
         {
             'file': file.filename,
             'patch': file.patch,
-            'content': get_file_content(repo, file.filename, pr.head.sha),
-            'existing_comments': get_existing_comments(pr, file.filename),
+            'existing_comments': comments_by_path.get(file.filename, []),
             'line_mapping': parse_patch_for_positions(file.patch) if file.patch else {}
         }
-        for file in pr.get_files()
+        for file in files
     ]
 
-def get_existing_comments(pr: PullRequest, file_path: str) -> List[Dict[str, Any]]:
-    """Get existing review comments for a specific file in the PR."""
-    comments = []
+def get_existing_comments(pr: PullRequest.PullRequest) -> Dict[str, List[Dict[str, Any]]]:
+    """Get all existing review comments in the PR, grouped by file path."""
+    comments_by_path: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
     pr_comments: List[PullRequestComment.PullRequestComment] = pr.get_review_comments()
     for comment in pr_comments:
-        if comment.path == file_path:
-            comments.append({
-                'id': comment.id,
-                'line': comment.position,
-                'body': comment.body,
-                'user': comment.user.login,
-                'created_at': comment.created_at.isoformat(),
-                'comment_obj': comment
-            })
-    return comments
+        comments_by_path[comment.path].append({
+            'id': comment.id,
+            'line': comment.position,
+            'body': comment.body,
+            'user': comment.user.login,
+            'created_at': comment.created_at.isoformat()
+        })
+    return comments_by_path
 
 def get_position_from_line(patch: str, target_line: int) -> Optional[int]:
     """Get the position in diff from line number."""
     if not patch:
         return None
-        
-    current_position = 0
-    current_line = 0
-    hunk_start = False
-    
-    for line in patch.split('\n'):
-        current_position += 1
-        if line.startswith('@@'):
-            hunk_start = True
-            match = re.search(r'@@ -\d+,?\d* \+(\d+),?\d* @@', line)
-            if match:
-                current_line = int(match.group(1)) - 1
-            continue
-        
-        if hunk_start and not line.startswith('-'):
-            current_line += 1
-            if current_line == target_line:
-                return current_position
-    
+
+    for current_line, position in iter_new_file_lines(patch):
+        if current_line == target_line:
+            return position
+
     return None
 
+# Markdown code fence markers that LLMs wrap their JSON in
+CODE_BLOCK_MARKER_RE = re.compile(r'```json\s*|\s*```')
+
 def clean_json_string(json_str: str) -> str:
     """Clean and format JSON string from LLM response."""
     try:
         # If it's already valid JSON, return it
-        parsed = json.loads(json_str)
+        parsed = orjson.loads(json_str)
         # Only add comments_to_delete if it's a review response
         if "comments" in parsed and "comments_to_delete" not in parsed:
             parsed["comments_to_delete"] = []
-        return json.dumps(parsed)
-    except json.JSONDecodeError:
+        return orjson.dumps(parsed).decode()
+    except orjson.JSONDecodeError:
         pass
 
     # Remove any leading/trailing whitespace
     json_str = json_str.strip()
     
     # Remove any markdown code block markers
-    json_str = re.sub(r'```json\s*|\s*```', '', json_str)
+    json_str = CODE_BLOCK_MARKER_RE.sub('', json_str)
     
     # Special handling for responses starting with newline and "comments"
     if json_str.startswith('\n'):
@@ -213,40 +217,118 @@ def clean_json_string(json_str: str) -> str:
     
     try:
         # Try to parse and format the JSON
-        parsed = json.loads(json_str)
+        parsed = orjson.loads(json_str)
         
         # Only add comments_to_delete for review responses
         if "comments" in parsed and "comments_to_delete" not in parsed:
             parsed["comments_to_delete"] = []
             
-        return json.dumps(parsed)
-    except json.JSONDecodeError as e:
+        return orjson.dumps(parsed).decode()
+    except orjson.JSONDecodeError as e:
         logging.error(f"Failed to parse JSON after cleaning: {e}")
         # Return a valid empty response as fallback
         return '{"comments": []}'
 
-def review_code(diff_files: List[Dict[str, Any]], project_context: str, pr_metadata: Dict[str, Any], extra_prompt: str = "") -> Tuple[List[CodeReviewComment], List[int]]:
-    """Review code changes using LangChain and OpenAI."""
-    llm_client = LLMClient()
-    llm = llm_client.get_client()
-    
-    parser = PydanticOutputParser(pydantic_object=CodeReviewResponse)
+FILE_REVIEW_TEMPLATE = """File: {file_name}
 
-    # Format PR metadata for context
-    pr_context = f"""
-PR Title: {pr_metadata.get('title', 'N/A')}
-PR Description: {pr_metadata.get('description', 'N/A')}
-Labels: {', '.join(pr_metadata.get('labels', []))}
-Type of Change: {pr_metadata.get('type_of_change', 'N/A')}
-Key Areas to Review: {pr_metadata.get('key_areas', 'N/A')}
-Related Issues: {pr_metadata.get('related_issues', 'N/A')}
-Testing Done: {pr_metadata.get('testing_done', 'N/A')}
-Additional Notes: {pr_metadata.get('additional_notes', 'N/A')}
-Commits: {pr_metadata.get('commits', 'N/A')}
-"""
+These are the ONLY valid lines you can comment on:
+{valid_lines}
+{existing_comments}
+Diff to review:
+{code_diff}"""
+
+def format_file_review(file: Dict[str, Any]) -> str:
+    """Format one file's diff, valid lines and existing comments for the review prompt."""
+    # Most files on a first review have no comments yet; leave the section out entirely for them
+    existing_comments_text = ""
+    if file.get('existing_comments'):
+        existing_comments_text = "\nExisting comments:\n" + "\n".join([
+            f"Comment ID {comment['id']} at Line {comment['line']}: {comment['body']} (by {comment['user']} at {comment['created_at']})"
+            for comment in file['existing_comments']
+        ]) + "\n"
+
+    # Format valid lines with their content
+    valid_lines = "\n".join(f"Line {line_num}: {content}" for line_num, content in file['line_mapping'].items())
+
+    return FILE_REVIEW_TEMPLATE.format(
+        file_name=file['file'],
+        code_diff=file['patch'],
+        existing_comments=existing_comments_text,
+        valid_lines=valid_lines
+    )
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are Dr. OtterAI, an expert code reviewer. Review code changes and provide specific, actionable feedback.
+HUNK_START_RE = re.compile(r'^@@', re.MULTILINE)
+
+def split_file_for_review(file: Dict[str, Any], max_chars: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Split a file with a very large patch into windows of whole hunks, reviewed separately."""
+    max_chars = max_chars or REVIEW_BATCH_MAX_CHARS
+    patch = file['patch']
+    if len(patch) <= max_chars:
+        return [file]
+
+    # Hunk headers carry absolute line numbers, so each window maps its own lines correctly
+    starts = [match.start() for match in HUNK_START_RE.finditer(patch)] or [0]
+    starts[0] = 0  # Keep anything before the first hunk with it
+    bounds = starts[1:] + [len(patch) + 1]
+
+    windows = []
+    window_start = 0
+    for hunk_start, hunk_end in zip(starts, bounds):
+        # Close the window before a hunk that would push it over the limit. The window would be emitted
+        # as patch[window_start:hunk_end - 1] (without the newline joining it to the next hunk), so
+        # that's its length; computed rather than sliced to avoid copying the patch per hunk
+        if hunk_start > window_start and hunk_end - 1 - window_start > max_chars:
+            windows.append(patch[window_start:hunk_start - 1])
+            window_start = hunk_start
+    windows.append(patch[window_start:])
+
+    return [
+        dict(file, patch=window, line_mapping=parse_patch_for_positions(window))
+        for window in windows
+    ]
+
+def group_files_for_review(diff_files: List[Dict[str, Any]], max_chars: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+    """Pack consecutive small files into groups that are reviewed with a single LLM call."""
+    max_chars = max_chars or REVIEW_BATCH_MAX_CHARS
+    # Windows of one file are packed greedily against the same limit, so two never share a group
+    groups: List[List[Dict[str, Any]]] = []
+    group_chars = 0
+    for file in diff_files:
+        size = len(file['patch'])
+        if (
+            not groups
+            or len(groups[-1]) >= REVIEW_BATCH_MAX_FILES
+            or group_chars + size > max_chars
+        ):
+            # Start a new group; a patch over the limit simply ends up alone in its own
+            groups.append([])
+            group_chars = 0
+        groups[-1].append(file)
+        group_chars += size
+    return groups
+
+def dedupe_review_units(review_units: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]]]:
+    """Drop units whose patch repeats an earlier one, returning the paths each kept path stands for."""
+    # Copies of the same change (vendored files, mirrored boilerplate) get the same review, so
+    # only the first is sent and its comments are copied to the rest. Units with existing
+    # comments are always kept, since those comments differ per file. Whole files are compared,
+    # before windowing, so dropping a copy never leaves two windows of one file side by side
+    unique_units: List[Dict[str, Any]] = []
+    duplicate_paths: Dict[str, List[str]] = defaultdict(list)
+    first_by_patch: Dict[str, Dict[str, Any]] = {}
+    for unit in review_units:
+        if unit['existing_comments']:
+            unique_units.append(unit)
+            continue
+        first = first_by_patch.setdefault(unit['patch'], unit)
+        if first is unit:
+            unique_units.append(unit)
+        else:
+            duplicate_paths[first['file']].append(unit['file'])
+    return unique_units, duplicate_paths
+
+REVIEW_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are Dr. OtterAI, an expert code reviewer. Review code changes and provide specific, actionable feedback.
 
 IMPORTANT RULES:
 1. ONLY comment on lines that are part of the provided diff
@@ -265,105 +347,185 @@ IMPORTANT RULES:
 
 {context}
 
+Below is the PR metadata that you should use to review the code and analyze the changes:
+{pr_context}
+
 {extra_instructions}
 
 {format_instructions}
 
 Ensure your response is complete and properly formatted JSON."""),
-        ("human", """Review this code change:
+    ("human", """Review these code changes. Set each comment's path to the file it is about.
 
-File: {file_name}
+{files}""")
+])
 
-These are the ONLY valid lines you can comment on:
-{valid_lines}
-
-Existing comments:
-{existing_comments}
+def iter_review_code(diff_files: List[Dict[str, Any]], project_context: str, pr_metadata: Dict[str, Any], extra_prompt: str = "", concurrency: int = REVIEW_CONCURRENCY) -> Iterator[Tuple[List[CodeReviewComment], List[int]]]:
+    """Review code changes, yielding each file group's comments and comment IDs to delete as its review completes."""
+    # Binary and rename-only files have no patch, so there are no lines to comment on
+    diff_files = [file for file in diff_files if file['line_mapping']]
+    if not diff_files:
+        return
 
-Below is the PR metadata that you should use to review the code and analyze the changes:
-{pr_context}
+    llm_client = LLMClient()
+    llm = llm_client.get_client()
 
-Diff to review:
-{code_diff}""")
-    ])
-    
-    comments = []
-    comments_to_delete = set()
+    # Format PR metadata for context
+    pr_context = f"""
+PR Title: {pr_metadata.get('title', 'N/A')}
+PR Description: {pr_metadata.get('description', 'N/A')}
+Labels: {', '.join(pr_metadata.get('labels', []))}
+Type of Change: {pr_metadata.get('type_of_change', 'N/A')}
+Key Areas to Review: {pr_metadata.get('key_areas', 'N/A')}
+Related Issues: {pr_metadata.get('related_issues', 'N/A')}
+Testing Done: {pr_metadata.get('testing_done', 'N/A')}
+Additional Notes: {pr_metadata.get('additional_notes', 'N/A')}
+Commits: {pr_metadata.get('commits', 'N/A')}
+"""
     
-    for file in diff_files:
+    # Instructions, project context and PR metadata are the same for every file, so the system message
+    # is rendered once. Everything that doesn't vary sits in it, ahead of the per-file diffs, so every
+    # call in the batch starts with the same long prefix that providers with automatic prefix caching
+    # (e.g. OpenAI) can reuse after the first request
+    system_template, human_template = REVIEW_PROMPT.messages
+    system_message = system_template.format(
+        context=project_context,
+        pr_context=pr_context,
+        extra_instructions=extra_prompt,
+        format_instructions=REVIEW_FORMAT_INSTRUCTIONS
+    )
+
+    # Size windows so each prompt fits the model's context instead of failing at the provider.
+    # Patch lines appear twice in a prompt (diff and valid lines), hence half the leftover chars
+    prompt_tokens = int(llm_client.get_token_limit() * REVIEW_PROMPT_CONTEXT_SHARE) - estimate_tokens(system_message.content)
+    max_chars = min(REVIEW_BATCH_MAX_CHARS, max(REVIEW_MIN_WINDOW_CHARS, prompt_tokens * 4 // 2))
+
+    # Small files share one call, so a PR of many small changes doesn't pay the request
+    # overhead once per file
+    reviewed_groups = []
+    prompts = []
+    unique_files, duplicate_paths = dedupe_review_units(diff_files)
+    review_units = []
+    for file in unique_files:
+        # Windows keep their file's path, so each stands for the same copies
+        review_units.extend(split_file_for_review(file, max_chars))
+    for group in group_files_for_review(review_units, max_chars):
         try:
-            # Format existing comments
-            existing_comments_text = "No existing comments."
-            if file.get('existing_comments'):
-                existing_comments_text = "\n".join([
-                    f"Comment ID {comment['id']} at Line {comment['line']}: {comment['body']} (by {comment['user']} at {comment['created_at']})"
-                    for comment in file['existing_comments']
-                ])
-
-            # Format valid lines with their content
-            lines_info = []
-            for line_num, info in file['line_mapping'].items():
-                lines_info.append(f"Line {line_num}: {info['content']}")
-            valid_lines = "\n".join(lines_info)
-
-            # Format the prompt with all variables
-            formatted_prompt = prompt.format(
-                file_name=file['file'],
-                code_diff=file['patch'],
-                existing_comments=existing_comments_text,
-                valid_lines=valid_lines,
-                context=project_context,
-                extra_instructions=extra_prompt,
-                format_instructions=parser.get_format_instructions(),
-                pr_context=pr_context
-            )
+            # Only the file-specific human message is formatted per group
+            prompts.append([system_message, human_template.format(
+                files="\n\n---\n\n".join(format_file_review(file) for file in group)
+            )])
+            reviewed_groups.append(group)
+        except Exception as e:
+            logging.error(f"Error processing files {', '.join(file['file'] for file in group)}: {str(e)}")
+            continue
 
-            # Get raw response from LLM
-            raw_result = llm.invoke(formatted_prompt)
-            
-            try:
-                # Parse the response using LangChain's parser
-                result = parser.parse(raw_result.content)
-                
-                # Validate comments
-                valid_comments = []
-                for comment in result.comments:
-                    # Set the file path if not already set
-                    if not comment.path:
-                        comment.path = file['file']
-                        
-                    if comment.line in file['line_mapping']:
-                        if validate_comment_position(file['patch'], comment.line):
-                            valid_comments.append(comment)
-                        else:
-                            logging.warning(f"⚠️ Invalid line {comment.line} in {file['file']}")
-                    else:
-                        logging.warning(f"⚠️ Rejected invalid line {comment.line} for file {file['file']}")
-                    if comment.body == "":
-                        logging.warning(f"⚠️ Rejected empty comment for file {file['file']}")
-                
-                comments.extend(valid_comments)
-                if result.comments_to_delete:
-                    comments_to_delete.update(result.comments_to_delete)
-                    
-            except Exception as e:
-                logging.error(f"Error processing file {file['file']}: {str(e)}")
-                logging.error(f"Raw response: {raw_result.content}")
+    # A re-run over the same diff (redelivered webhook, re-requested review) sends byte-identical
+    # prompts, so responses are cached by prompt and model (and endpoint, as a self-hosted server may
+    # serve a different model under the same name) and only the misses go to the LLM
+    model_key = llm_client.get_cache_key_parts()
+    keys = [cache_key(*model_key, *(message.content for message in prompt)) for prompt in prompts]
+    cached_results = [get_cached('review', key) for key in keys]
+    misses = [i for i, raw_result in enumerate(cached_results) if raw_result is None]
+
+    # Cached groups are ready now, so hand them back before waiting on any LLM call
+    for group, raw_result in zip(reviewed_groups, cached_results):
+        if raw_result is not None:
+            result = validate_review_result(group, raw_result, duplicate_paths)
+            if result is not None:
+                yield result
+
+    if misses:
+        logging.info(f"🧠 Reviewing {len(misses)} of {len(prompts)} file groups ({len(prompts) - len(misses)} cached)")
+        # Review the groups concurrently and hand each one back as soon as its call completes, so its
+        # comments can be posted while the rest are still in flight; a failed call is returned in
+        # place so it only skips its own files
+        fresh_results = llm.batch_as_completed([prompts[i] for i in misses], config={'max_concurrency': concurrency}, return_exceptions=True)
+        for miss_index, fresh_result in fresh_results:
+            i = misses[miss_index]
+            if isinstance(fresh_result, Exception):
+                logging.error(f"Error processing files {', '.join(file['file'] for file in reviewed_groups[i])}: {str(fresh_result)}")
                 continue
-                
-        except Exception as e:
-            logging.error(f"Error processing file {file['file']}: {str(e)}")
+            result = validate_review_result(reviewed_groups[i], fresh_result.content, duplicate_paths)
+            if result is not None:
+                # Only responses that parsed are cached, so a malformed answer is retried next run
+                set_cached('review', keys[i], fresh_result.content)
+                yield result
+
+def validate_review_result(group: List[Dict[str, Any]], raw_result: str, duplicate_paths: Dict[str, List[str]]) -> Optional[Tuple[List[CodeReviewComment], List[int]]]:
+    """Parse one group's review response, keeping only comments that can be placed on its files."""
+    file_names = ', '.join(file['file'] for file in group)
+    try:
+        result = parse_review_response(raw_result)
+    except Exception as e:
+        logging.error(f"Error processing files {file_names}: {str(e)}")
+        logging.error(f"Raw response: {raw_result}")
+        return None
+
+    # Validate comments straight into the result list against the file each one names.
+    # line_mapping holds exactly the commentable lines of a patch, so a hash lookup is the
+    # whole position check; no need to rescan the patch per comment
+    comments = []
+    # A group may hold several windows of one path, each with its own line_mapping
+    units_by_path: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for file in group:
+        units_by_path[file['file']].append(file)
+    for comment in result.comments:
+        # Set the file path if not already set and there's only one file it can be
+        if not comment.path and len(group) == 1:
+            comment.path = group[0]['file']
+        units = units_by_path.get(comment.path)
+        if not units:
+            logging.warning(f"⚠️ Rejected comment for unknown file {comment.path!r} in {file_names}")
             continue
-    
+        file = next((unit for unit in units if comment.line in unit['line_mapping']), None)
+        if file is None:
+            logging.warning(f"⚠️ Rejected invalid line {comment.line} for file {comment.path}")
+            continue
+        if not comment.body:
+            logging.warning(f"⚠️ Rejected empty comment for file {file['file']}")
+            continue
+        comments.append(comment)
+        comments.extend(comment.model_copy(update={'path': path}) for path in duplicate_paths.get(file['file'], []))
+
+    # get_review_comment is repo-scoped, so only IDs of comments shown to the model for these files
+    # may be deleted; anything else would let a made-up ID remove a comment on another PR
+    existing_ids = {comment['id'] for file in group for comment in file.get('existing_comments', [])}
+    comments_to_delete = []
+    for comment_id in result.comments_to_delete or []:
+        if comment_id not in existing_ids:
+            logging.warning(f"⚠️ Ignored deletion of comment {comment_id}, not an existing comment on {file_names}")
+            continue
+        comments_to_delete.append(comment_id)
+
+    return comments, comments_to_delete
+
+def review_code(diff_files: List[Dict[str, Any]], project_context: str, pr_metadata: Dict[str, Any], extra_prompt: str = "") -> Tuple[List[CodeReviewComment], List[int]]:
+    """Review code changes using LangChain and OpenAI."""
+    comments: List[CodeReviewComment] = []
+    comments_to_delete = set()
+    for group_comments, group_comments_to_delete in iter_review_code(diff_files, project_context, pr_metadata, extra_prompt):
+        comments.extend(group_comments)
+        comments_to_delete.update(group_comments_to_delete)
     return comments, list(comments_to_delete)
 
+# Compiled once per section name instead of formatting and looking up the pattern on every call
+SECTION_PATTERNS: Dict[str, re.Pattern] = {}
+CHECKED_BOX_RE = re.compile(r"\[x\]\s*(.*?)\n")
+
+def get_section_pattern(section_name: str) -> re.Pattern:
+    """Get the compiled pattern matching a PR description section's content."""
+    pattern = SECTION_PATTERNS.get(section_name)
+    if pattern is None:
+        pattern = SECTION_PATTERNS[section_name] = re.compile(rf"#+\s*{section_name}.*?\n(.*?)(?=\n#|\Z)", re.DOTALL)
+    return pattern
+
 def extract_section_content(body: str, section_name: str) -> str:
     """Extract content from a specific section in PR description."""
     if not body:
         return "N/A"
         
-    pattern = rf"#+\s*{section_name}.*?\n(.*?)(?=\n#|\Z)"
-    match = re.search(pattern, body, re.DOTALL)
+    match = get_section_pattern(section_name).search(body)
     if match:
         content = match.group(1).strip()
         return content if content else "N/A"
@@ -374,8 +536,7 @@ def extract_type_of_change(body: str) -> str:
     if not body:
         return "N/A"
         
-    pattern = r"\[x\]\s*(.*?)\n"
-    matches = re.finditer(pattern, body)
+    matches = CHECKED_BOX_RE.finditer(body)
     changes = [match.group(1).strip() for match in matches]
     return ", ".join(changes) if changes else "N/A"
 
@@ -395,64 +556,71 @@ def extract_additional_notes(body: str) -> str:
     """Extract additional notes."""
     return extract_section_content(body, "Additional Notes")
 
-def generate_pr_summary(pr_metadata: Dict[str, Any], diff_files: List[Dict[str, Any]]) -> str:
-    """🔍 Generate a comprehensive PR summary with mermaid diagrams."""
-    llm_client = LLMClient()
-    llm = llm_client.get_client()
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """Generate a comprehensive PR summary with the following sections:
-        1. 🎯 Overview - What the PR is trying to achieve
-        2. 🔄 Code Changes - Summary of main code changes
-        3. 🚨 Issues Found - Any potential issues or concerns
-        4. 📊 Flow Diagrams - Use mermaid syntax to create:
-           - Component interaction diagram
-           - Code flow diagram
-           - Data flow diagram (if applicable)
-        
-        Use markdown and mermaid syntax for diagrams. Be concise but informative.
-        Focus on the most important aspects of the changes."""),
-        ("human", """PR Metadata: {pr_metadata}
-        Files Changed: {diff_files}"""),
-    ])
+PR_SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Generate a comprehensive PR summary with the following sections:
+    1. 🎯 Overview - What the PR is trying to achieve
+    2. 🔄 Code Changes - Summary of main code changes
+    3. 🚨 Issues Found - Any potential issues or concerns
+    4. 📊 Flow Diagrams - Use mermaid syntax to create:
+       - Component interaction diagram
+       - Code flow diagram
+       - Data flow diagram (if applicable)
+    
+    Use markdown and mermaid syntax for diagrams. Be concise but informative.
+    Focus on the most important aspects of the changes."""),
+    ("human", """PR Metadata: {pr_metadata}
+    Files Changed: {diff_files}"""),
+])
+
+def format_pr_summary_prompt(pr_metadata: Dict[str, Any], diff_files: List[Dict[str, Any]]) -> str:
+    """Format the PR summary prompt for the given PR metadata and changed files."""
+    # Compact JSON keeps the prompt small; full file contents and line maps aren't needed for a summary
+    changed_files = [{'file': file['file'], 'patch': file['patch']} for file in diff_files]
+    return PR_SUMMARY_PROMPT.format(
+        pr_metadata=orjson.dumps(pr_metadata, default=str).decode(),
+        diff_files=orjson.dumps(changed_files).decode()
+    )
 
-    summary = llm.invoke(prompt.format(pr_metadata=pr_metadata, diff_files=diff_files))
-    return summary.content
+REVIEW_SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Generate a detailed summary of the code review comments.
+    Use markdown in your summary.
+    Use code blocks for code snippets.
+    Format as a list with categories:
+    
+    ## 🎯 Critical Issues
+    - [File Path] - [Line] - [Comment]
+    
+    ## 💡 Improvements
+    - [File Path] - [Line] - [Comment]
+    
+    ## ✨ Good Practices
+    - [File Path] - [Line] - [Comment]"""),
+    ("human", "Comments: {comments}"),
+])
 
 def generate_review_summary(comments: List[CodeReviewComment], pr_metadata: Dict[str, Any], diff_files: List[Dict[str, Any]]) -> str:
     """✨ Generate both review and PR summaries."""
     llm_client = LLMClient()
-    llm = llm_client.get_client()
-
-    # Generate review comments summary
-    review_prompt = ChatPromptTemplate.from_messages([
-        ("system", """Generate a detailed summary of the code review comments.
-        Use markdown in your summary.
-        Use code blocks for code snippets.
-        Format as a list with categories:
-        
-        ## 🎯 Critical Issues
-        - [File Path] - [Line] - [Comment]
-        
-        ## 💡 Improvements
-        - [File Path] - [Line] - [Comment]
-        
-        ## ✨ Good Practices
-        - [File Path] - [Line] - [Comment]"""),
-        ("human", "Comments: {comments}"),
-    ])
-
-    review_summary = llm.invoke(review_prompt.format(comments=comments))
-    
-    # Generate PR summary with diagrams
-    pr_summary = generate_pr_summary(pr_metadata, diff_files)
+    # Summaries don't need the review model, so they run on the fast tier
+    llm = llm_client.get_client('fast')
+
+    # The PR summary (with diagrams) and the review comments summary are independent,
+    # so send them as one batch instead of waiting on each in turn
+    prompts = [format_pr_summary_prompt(pr_metadata, diff_files)]
+    # No need to ask the LLM to summarize nothing
+    if comments:
+        prompts.append(REVIEW_SUMMARY_PROMPT.format(comments=comments))
+
+    responses = llm.batch(prompts)
+    pr_summary = responses[0].content
+    review_summary = responses[1].content if comments else "No review comments, looks good! 🎉"
     
     # Combine both summaries
     combined_summary = f"""# 🦦 CoriAI Review Summary
 
 <details>
 <summary>📝 Review Comments</summary>
-{review_summary.content}
+{review_summary}
 </details>
 
 <details>
@@ -463,6 +631,67 @@ def generate_review_summary(comments: List[CodeReviewComment], pr_metadata: Dict
     
     return combined_summary
 
+def post_review_results(pr: PullRequest.PullRequest, commit: Any, comments: List[CodeReviewComment], comments_to_delete: List[int]) -> None:
+    """Delete the comments the review marked as outdated, then post its new comments."""
+    # Delete comments first
+    for comment_id in comments_to_delete:
+        try:
+            pr.get_review_comment(comment_id).delete()
+            print(f"🗑️ Deleted comment {comment_id} as suggested by AI")
+        except Exception as e:
+            print(f"❌ Error deleting comment {comment_id}: {str(e)}")
+
+    if not comments:
+        return
+
+    # One review carries all of a group's comments, so posting them is a single write instead of
+    # one per comment (PyGithub spaces writes a second apart). If any comment is rejected the whole
+    # review is (422), so fall back to posting them one by one. Other failures may have created the
+    # review anyway, so posting the comments again could double them
+    try:
+        pr.create_review(
+            commit=commit,
+            body=REVIEW_BODY,
+            event="COMMENT",
+            comments=[{'path': comment.path, 'line': comment.line, 'body': comment.body} for comment in comments]
+        )
+        for comment in comments:
+            print(f"🎯 Added review comment at line {comment.line} in {comment.path} {comment.body}")
+        return
+    except Exception as e:
+        if not (isinstance(e, GithubException) and e.status == 422):
+            print(f"❌ Error posting review comments: {str(e)}")
+            return
+        print(f"⚠️ Could not post comments as one review, posting them one by one: {str(e)}")
+
+    # Add new comments
+    for comment in comments:
+        try:
+            pr.create_review_comment(
+                body=comment.body,
+                commit=commit,
+                path=comment.path,
+                line=comment.line  # Using line number directly
+            )
+            print(f"🎯 Added review comment at line {comment.line} in {comment.path} {comment.body}")
+        except Exception as e:
+            print(f"❌ Error creating comment: {str(e)}")
+
+def get_review_concurrency() -> int:
+    """Read the review concurrency input, falling back to the default when it isn't a positive number."""
+    value = os.getenv('INPUT_REVIEW_CONCURRENCY', '').strip()
+    if not value:
+        return REVIEW_CONCURRENCY
+    try:
+        concurrency = int(value)
+    except ValueError:
+        logging.warning(f"⚠️ Invalid review_concurrency {value!r}, using {REVIEW_CONCURRENCY}")
+        return REVIEW_CONCURRENCY
+    if concurrency < 1:
+        logging.warning(f"⚠️ review_concurrency must be at least 1, got {concurrency}; using 1")
+        return 1
+    return concurrency
+
 def main():
     """Main entry point for the GitHub Action."""
     github_token = os.getenv('INPUT_GITHUB_TOKEN')
@@ -473,70 +702,71 @@ def main():
     repo = os.getenv('GITHUB_REPOSITORY')
     pr_number = int(os.getenv('PR_NUMBER'))
     extra_prompt = os.getenv('INPUT_EXTRA_PROMPT', '')
+    review_concurrency = get_review_concurrency()
     workspace = os.getenv('GITHUB_WORKSPACE', '.')
     
     logging.info("🦦 Dr. OtterAI starting code review...")
 
     # Handle GitHub operations
-    g = Github(github_token)
+    # One pooled session shared by every PyGithub call in the run
+    g = Github(github_token, pool_size=GITHUB_CONCURRENCY, retry=GithubRetry(total=GITHUB_MAX_RETRIES))
     repo = g.get_repo(repo)
     pr = repo.get_pull(pr_number)
     get_commit = repo.get_commit(pr.head.sha)
     
-    # Generate project context
-    project_context = generate_review_context(workspace)
+    # Index and analyze the workspace while the PR data is fetched from GitHub, and open the
+    # connections the concurrent review calls will use so they don't each start with a handshake
+    context_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='context')
+    try:
+        project_context_future = context_executor.submit(generate_review_context, workspace)
+        prewarm_future = context_executor.submit(LLMClient().prewarm, review_concurrency)
 
-    # Get PR changes
-    diff_files = get_pr_diff(repo, pr)
-    
-    # Get PR metadata
-    pr_metadata = {
-        'title': pr.title,
-        'description': pr.body,
-        'labels': [label.name for label in pr.labels],
-        'type_of_change': extract_type_of_change(pr.body),
-        'key_areas': extract_key_areas(pr.body),
-        'related_issues': extract_related_issues(pr.body),
-        'testing_done': extract_testing_done(pr.body),
-        'additional_notes': extract_additional_notes(pr.body),
-        'commits': [{'sha': commit.sha, 'title': commit.commit.message.split('\n')[0], 'body': commit.commit.message.split('\n')[1:]} for commit in pr.get_commits()],
-    }
-
-    # Review code with project context
-    comments, comments_to_delete = review_code(diff_files, project_context, pr_metadata, extra_prompt)
+        # Get PR changes
+        diff_files = get_pr_diff(repo, pr)
     
+        # Get PR metadata
+        pr_metadata = {
+            'title': pr.title,
+            'description': pr.body,
+            'labels': [label.name for label in pr.labels],
+            'type_of_change': extract_type_of_change(pr.body),
+            'key_areas': extract_key_areas(pr.body),
+            'related_issues': extract_related_issues(pr.body),
+            'testing_done': extract_testing_done(pr.body),
+            'additional_notes': extract_additional_notes(pr.body),
+            'commits': [{'sha': commit.sha, 'title': commit.commit.message.split('\n')[0], 'body': commit.commit.message.split('\n')[1:]} for commit in pr.get_commits()],
+        }
 
-    # Delete comments first
-    for comment_id in comments_to_delete:
-        try:
-            with lock:
-                # Find the comment object
-                for file in diff_files:
-                    for comment in file.get('existing_comments', []):
-                        if comment['id'] == comment_id:
-                            comment['comment_obj'].delete()
-                            print(f"🗑️ Deleted comment {comment_id} as suggested by AI")
-                            break
-        except Exception as e:
-            print(f"❌ Error deleting comment {comment_id}: {str(e)}")
-    
-    # Add new comments
-    for comment in comments:
-        try:
-            with lock:
-                pr.create_review_comment(
-                    body=comment.body,
-                    commit=get_commit,
-                    path=comment.path,
-                    line=comment.line  # Using line number directly
-                )
-                print(f"🎯 Added review comment at line {comment.line} in {comment.path} {comment.body}")
-        except Exception as e:
-            print(f"❌ Error creating comment: {str(e)}")
+        project_context = project_context_future.result()
+        # Pre-warming only saves handshakes, so the review goes ahead without it
+        if prewarm_future.exception() is not None:
+            logging.warning(f"⚠️ Could not pre-warm LLM connections: {str(prewarm_future.exception())}")
+    except BaseException:
+        # On failure, cancel what hasn't started instead of waiting for the analysis as a `with` block would
+        context_executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    context_executor.shutdown()
+
+    # Post each group's results as soon as its review completes, while the rest are still in flight.
+    # One poster thread keeps the writes sequential, as GitHub asks for content-creating requests
+    comments: List[CodeReviewComment] = []
+    requested_deletions = set()
+    post_futures = []
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='poster') as poster:
+        for group_comments, group_comments_to_delete in iter_review_code(diff_files, project_context, pr_metadata, extra_prompt, review_concurrency):
+            comments.extend(group_comments)
+            # Windows of one file share its existing comments, so a deletion can be suggested twice
+            new_deletions = [comment_id for comment_id in group_comments_to_delete if comment_id not in requested_deletions]
+            requested_deletions.update(new_deletions)
+            post_futures.append(poster.submit(post_review_results, pr, get_commit, group_comments, new_deletions))
+
+        # The summary only needs the review results, so generate it while the last comments are posted
+        summary = generate_review_summary(comments, pr_metadata, diff_files)
+
+    # Re-raise anything that went wrong while posting rather than losing it with the thread
+    for future in post_futures:
+        future.result()
 
-    
-    # generate a summary of the review
-    summary = generate_review_summary(comments, pr_metadata, diff_files)
     pr.create_issue_comment(
         body=(
             f"Hey @{pr.user.login}! 👋\n\n"
@@ -550,6 +780,10 @@ def main():
             "~ CoriAI ✨"
         )
     )
+
+    # Keep a persisted cache from growing without bound across runs
+    for namespace in ('review', 'analysis'):
+        prune_cache(namespace)
     
     print("✨ Code review completed!")
 
@@ -0,0 +1,29 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from cori_ai.cache import cache_key, get_cached, set_cached
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patcher = patch('cori_ai.cache.CACHE_DIR', Path(self.tmp_dir.name))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        key = cache_key("openai", "gpt-4o-mini", "prompt")
+        set_cached("analysis", key, "🦦 analysis")
+        self.assertEqual(get_cached("analysis", key), "🦦 analysis")
+
+    def test_missing_entry(self):
+        self.assertIsNone(get_cached("analysis", cache_key("nothing")))
+
+    def test_key_parts_are_separated(self):
+        self.assertNotEqual(cache_key("ab", "c"), cache_key("a", "bc"))
+
+if __name__ == '__main__':
+    unittest.main()
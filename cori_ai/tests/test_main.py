@@ -1,13 +1,31 @@
 import unittest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch, MagicMock, AsyncMock
+import os
 import json
+import asyncio
+import tempfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from cori_ai.review import (
     clean_json_string, 
     review_code, 
+    iter_review_code,
     CodeReviewComment, 
     CodeReviewResponse,
-    validate_comment_position
+    validate_comment_position,
+    get_pr_diff,
+    parse_review_response,
+    generate_review_summary,
+    post_review_results,
+    split_file_for_review,
+    get_review_concurrency
 )
+from github import GithubException
+from cori_ai.llm_client import LLMClient, HTTP_LIMITS, get_token_limit, estimate_tokens, resolve_provider
+from cori_ai.cache import set_cached, prune_cache
+from cori_ai.indexer import fit_to_token_budget, read_text_file, compress_text, index_codebase, analyze_project_structure, get_file_type
 
 class TestCleanJsonString(unittest.TestCase):
     def test_clean_basic_json(self):
@@ -47,17 +65,79 @@ class TestValidateCommentPosition(unittest.TestCase):
     def test_empty_patch(self):
         self.assertFalse(validate_comment_position("", 1))
 
+class TestParseReviewResponse(unittest.TestCase):
+    def test_parse_fenced_json(self):
+        text = '```json\n{"comments": [{"path": "test.py", "line": 2, "body": "✅ Test comment"}]}\n```'
+        result = parse_review_response(text)
+        self.assertEqual(result.comments[0].line, 2)
+        self.assertEqual(result.comments_to_delete, [])
+
+    def test_parse_fenced_json_with_snippet_in_comment(self):
+        body = "Use a context manager:\n```python\nwith open(path) as f:\n    data = f.read()\n```"
+        text = '```json\n' + json.dumps({"comments": [{"path": "test.py", "line": 2, "body": body}]}) + '\n```'
+        with patch('cori_ai.review.REVIEW_PARSER') as mock_parser:
+            result = parse_review_response(text)
+        mock_parser.parse.assert_not_called()
+        self.assertEqual(result.comments[0].body, body)
+
+    def test_parse_partial_json_falls_back(self):
+        text = '{"comments": [{"path": "test.py", "line": 2, "body": "✅ Test comment"}]'
+        result = parse_review_response(text)
+        self.assertEqual(len(result.comments), 1)
+
+class TestGetPrDiff(unittest.TestCase):
+    def setUp(self):
+        self.repo = Mock()
+        self.pr = Mock()
+        self.pr.head.sha = "abc123"
+        pr_file = Mock()
+        pr_file.filename = "test.py"
+        pr_file.patch = '@@ -1,3 +1,4 @@\n def test():\n+    print("test")\n     return True'
+        self.pr.get_files.return_value = [pr_file]
+        comment = Mock(id=3, path="test.py", position=2, body="Old comment")
+        comment.user.login = "test_user"
+        self.pr.get_review_comments.return_value = [comment]
+
+    def test_get_pr_diff(self):
+        diff_files = get_pr_diff(self.repo, self.pr)
+
+        self.assertEqual(len(diff_files), 1)
+        self.assertNotIn('content', diff_files[0])
+        self.assertEqual(diff_files[0]['existing_comments'][0]['id'], 3)
+        self.assertIn(2, diff_files[0]['line_mapping'])
+
+    def test_comments_fetched_while_files_are_listed(self):
+        comments_requested = threading.Event()
+        pr_files = self.pr.get_files.return_value
+        comments = self.pr.get_review_comments.return_value
+        # Listing the files only succeeds if the comments were already requested alongside it
+        self.pr.get_files.side_effect = lambda: pr_files if comments_requested.wait(timeout=5) else []
+        self.pr.get_review_comments.side_effect = lambda: comments_requested.set() or comments
+
+        diff_files = get_pr_diff(self.repo, self.pr)
+
+        self.assertEqual([diff_file['file'] for diff_file in diff_files], ["test.py"])
+
 class TestReviewCode(unittest.TestCase):
     def setUp(self):
         self.patcher1 = patch('cori_ai.review.LLMClient')
         self.patcher2 = patch('langchain.output_parsers.PydanticOutputParser')
         
+        # Keep review responses cached by one test from answering another
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.patcher3 = patch('cori_ai.cache.CACHE_DIR', Path(self.cache_dir.name))
+        
         self.mock_llm_client = self.patcher1.start()
         self.mock_parser_class = self.patcher2.start()
+        self.patcher3.start()
         
         self.mock_llm = Mock()
         self.mock_parser = Mock()
         self.mock_llm_client.return_value.get_client.return_value = self.mock_llm
+        self.mock_llm_client.return_value.get_token_limit.return_value = 128000
+        # Files are reviewed through llm.batch_as_completed; route it through batch and each prompt through the mocked invoke
+        self.mock_llm.batch.side_effect = lambda prompts, **kwargs: [self.mock_llm.invoke(p) for p in prompts]
+        self.mock_llm.batch_as_completed.side_effect = lambda prompts, **kwargs: enumerate(self.mock_llm.batch(prompts, **kwargs))
         self.mock_parser_class.return_value = self.mock_parser
         self.mock_parser.get_format_instructions.return_value = "format instructions"
         
@@ -65,13 +145,21 @@ class TestReviewCode(unittest.TestCase):
         self.test_file = {
             'file': 'test.py',
             'patch': '@@ -1,3 +1,4 @@\n def test():\n+    print("test")\n     return True',
-            'line_mapping': {2: {'content': '    print("test")', 'line': 2}},
+            'line_mapping': {2: '+    print("test")'},
             'existing_comments': []
         }
+        self.other_file = dict(
+            self.test_file,
+            file='other.py',
+            patch='@@ -1,3 +1,4 @@\n def other():\n+    print("other")\n     return True',
+            line_mapping={2: '+    print("other")'}
+        )
         
     def tearDown(self):
         self.patcher1.stop()
         self.patcher2.stop()
+        self.patcher3.stop()
+        self.cache_dir.cleanup()
 
     def test_review_code_success(self):
         # Mock LLM and parser responses
@@ -235,6 +323,26 @@ class TestReviewCode(unittest.TestCase):
         self.assertEqual(len(comments_to_delete), 1)
         self.assertEqual(comments_to_delete[0], 1)
 
+    def test_foreign_comment_ids_are_not_deleted(self):
+        self.test_file['existing_comments'] = [{
+            'id': 1,
+            'line': 2,
+            'body': "Old comment",
+            'user': "test_user",
+            'created_at': "2024-01-01T00:00:00Z"
+        }]
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({"comments": [], "comments_to_delete": [999]})
+        self.mock_llm.invoke.return_value = mock_response
+
+        comments, comments_to_delete = review_code(
+            diff_files=[self.test_file],
+            project_context="Test context",
+            pr_metadata=dict(title="Test title", description="Test description")
+        )
+
+        self.assertEqual(comments_to_delete, [])
+
     def test_review_code_empty_response(self):
         # Mock LLM and parser responses
         mock_response = MagicMock()
@@ -268,6 +376,163 @@ class TestReviewCode(unittest.TestCase):
         self.assertEqual(len(comments), 0)
         self.assertEqual(len(comments_to_delete), 0)
 
+    @patch('cori_ai.review.REVIEW_BATCH_MAX_CHARS', 50)
+    def test_duplicate_window_does_not_merge_windows_of_one_file(self):
+        hunks = ['@@ -1,1 +1,1 @@\n+a', '@@ -10,1 +10,1 @@\n+' + 'b' * 30, '@@ -20,1 +20,1 @@\n+c']
+        a_file = dict(self.test_file, file='a.py', patch='\n'.join(hunks), line_mapping={1: '+a', 10: '+b', 20: '+c'})
+        b_file = dict(self.test_file, file='b.py', patch=hunks[1], line_mapping={10: '+b'})
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({"comments": [{"path": "a.py", "line": 1, "body": "✅ Test comment"}]})
+        self.mock_llm.invoke.return_value = mock_response
+
+        comments, _ = review_code(diff_files=[b_file, a_file], project_context="Test context", pr_metadata={})
+
+        self.assertEqual(len(self.mock_llm.batch.call_args[0][0]), 4)
+        self.assertEqual([(comment.path, comment.line) for comment in comments], [("a.py", 1)])
+
+    @patch('cori_ai.review.REVIEW_BATCH_MAX_FILES', 1)
+    def test_review_code_failed_call_does_not_drop_others(self):
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({
+            "comments": [{"path": "test.py", "line": 2, "body": "✅ Test comment"}],
+            "comments_to_delete": []
+        })
+        self.mock_llm.batch.side_effect = None
+        self.mock_llm.batch.return_value = [Exception("rate limited"), mock_response]
+
+        comments, _ = review_code(
+            diff_files=[self.other_file, self.test_file],
+            project_context="Test context",
+            pr_metadata={}
+        )
+
+        self.assertEqual(len(self.mock_llm.batch.call_args[0][0]), 2)
+        self.assertEqual([comment.path for comment in comments], ["test.py"])
+
+    def test_review_code_groups_small_files_into_one_call(self):
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({
+            "comments": [
+                {"path": "other.py", "line": 2, "body": "✅ Other comment"},
+                {"path": "test.py", "line": 2, "body": "✅ Test comment"},
+                {"path": "unknown.py", "line": 2, "body": "❌ Not in this PR"},
+                {"path": "", "line": 2, "body": "❌ Can't tell which file"}
+            ],
+            "comments_to_delete": []
+        })
+        self.mock_llm.invoke.return_value = mock_response
+
+        comments, _ = review_code(
+            diff_files=[self.other_file, self.test_file],
+            project_context="Test context",
+            pr_metadata={}
+        )
+
+        prompts = self.mock_llm.batch.call_args[0][0]
+        self.assertEqual(len(prompts), 1)
+        self.assertIn("File: other.py", prompts[0][1].content)
+        self.assertIn("File: test.py", prompts[0][1].content)
+        self.assertEqual([comment.path for comment in comments], ["other.py", "test.py"])
+
+    @patch('cori_ai.review.REVIEW_BATCH_MAX_CHARS', 40)
+    def test_review_code_splits_large_patches_by_hunk(self):
+        patch_text = '@@ -1,2 +1,2 @@\n context\n+first hunk line\n@@ -20,2 +20,2 @@\n context\n+second hunk line'
+        large_file = dict(self.test_file, patch=patch_text, line_mapping={1: ' context', 2: '+first hunk line', 20: ' context', 21: '+second hunk line'})
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({"comments": [{"path": "test.py", "line": 21, "body": "✅ Test comment"}]})
+        self.mock_llm.invoke.return_value = mock_response
+
+        comments, _ = review_code(diff_files=[large_file], project_context="Test context", pr_metadata={})
+
+        prompts = self.mock_llm.batch.call_args[0][0]
+        self.assertEqual(len(prompts), 2)
+        self.assertIn("Line 2: +first hunk line", prompts[0][1].content)
+        self.assertNotIn("second hunk line", prompts[0][1].content)
+        self.assertIn("Line 21: +second hunk line", prompts[1][1].content)
+        # Only the window that contains line 21 can place a comment there
+        self.assertEqual([(comment.path, comment.line) for comment in comments], [("test.py", 21)])
+
+    def test_review_code_windows_fit_small_context(self):
+        hunks = [f'@@ -{i * 100},2 +{i * 100},2 @@\n context\n+' + 'x' * 1500 for i in range(1, 9)]
+        large_file = dict(self.test_file, patch='\n'.join(hunks), line_mapping={i * 100 + 1: '+x' for i in range(1, 9)})
+        self.mock_llm.invoke.return_value = MagicMock(content='{"comments": []}')
+
+        review_code(diff_files=[large_file], project_context="Test context", pr_metadata={})
+        self.assertEqual(len(self.mock_llm.batch.call_args[0][0]), 1)
+
+        self.mock_llm_client.return_value.get_token_limit.return_value = 4096
+        review_code(diff_files=[large_file], project_context="Other context", pr_metadata={})
+        prompts = self.mock_llm.batch.call_args[0][0]
+        self.assertGreater(len(prompts), 1)
+        self.assertTrue(all(estimate_tokens(system.content + human.content) < 4096 for system, human in prompts))
+
+    def test_review_code_reviews_identical_patches_once(self):
+        copy = dict(self.test_file, file='vendor/test.py')
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({"comments": [{"path": "test.py", "line": 2, "body": "✅ Test comment"}]})
+        self.mock_llm.invoke.return_value = mock_response
+
+        comments, _ = review_code(diff_files=[self.test_file, copy], project_context="Test context", pr_metadata={})
+
+        prompts = self.mock_llm.batch.call_args[0][0]
+        self.assertEqual(len(prompts), 1)
+        self.assertNotIn("vendor/test.py", prompts[0][1].content)
+        self.assertEqual([(comment.path, comment.line) for comment in comments], [("test.py", 2), ("vendor/test.py", 2)])
+
+    @patch('cori_ai.review.REVIEW_BATCH_MAX_FILES', 1)
+    def test_iter_review_code_yields_each_group_as_it_completes(self):
+        self.mock_llm.batch_as_completed.side_effect = lambda prompts, **kwargs: iter([
+            (1, MagicMock(content=json.dumps({"comments": [{"path": "test.py", "line": 2, "body": "✅ Test comment"}]}))),
+            (0, MagicMock(content=json.dumps({"comments": [], "comments_to_delete": [5]}))),
+        ])
+
+        other_file = dict(self.other_file, existing_comments=[{'id': 5, 'line': 2, 'body': "Old comment", 'user': "test_user", 'created_at': "2024-01-01T00:00:00Z"}])
+
+        results = list(iter_review_code([other_file, self.test_file], "Test context", {}))
+
+        self.assertEqual([[comment.path for comment in comments] for comments, _ in results], [["test.py"], []])
+        self.assertEqual([comments_to_delete for _, comments_to_delete in results], [[], [5]])
+
+    def test_review_code_rejects_empty_comments(self):
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({
+            "comments": [{"path": "test.py", "line": 2, "body": ""}],
+            "comments_to_delete": []
+        })
+        self.mock_llm.invoke.return_value = mock_response
+
+        comments, _ = review_code(diff_files=[self.test_file], project_context="Test context", pr_metadata={})
+
+        self.assertEqual(comments, [])
+
+    def test_review_code_reuses_cached_response(self):
+        mock_response = MagicMock()
+        mock_response.content = json.dumps({
+            "comments": [{"path": "test.py", "line": 2, "body": "✅ Test comment"}],
+            "comments_to_delete": []
+        })
+        self.mock_llm.invoke.return_value = mock_response
+
+        first, _ = review_code(diff_files=[self.test_file], project_context="Test context", pr_metadata={})
+        second, _ = review_code(diff_files=[self.test_file], project_context="Test context", pr_metadata={})
+
+        self.assertEqual(self.mock_llm.invoke.call_count, 1)
+        self.assertEqual(second, first)
+
+    def test_review_code_skips_files_without_patch(self):
+        binary_file = {'file': 'logo.png', 'patch': None, 'line_mapping': {}, 'existing_comments': []}
+
+        comments, comments_to_delete = review_code(
+            diff_files=[binary_file],
+            project_context="Test context",
+            pr_metadata={},
+            extra_prompt=""
+        )
+
+        self.assertEqual(comments, [])
+        self.assertEqual(comments_to_delete, [])
+        self.mock_llm_client.assert_not_called()
+
     def test_review_code_missing_path(self):
         # Mock LLM and parser responses
         mock_response = MagicMock()
@@ -310,5 +575,284 @@ class TestReviewCode(unittest.TestCase):
         self.assertEqual(comments[0].line, 2)
         self.assertEqual(comments[0].body, "✅ Test comment")
 
+class TestSplitFileForReview(unittest.TestCase):
+    def test_windows_fill_up_to_exactly_max_chars(self):
+        hunks = [f'@@ -{n},1 +{n},1 @@\n+hunk {n} line' for n in (1, 10, 20)]
+        file = {'file': 'test.py', 'patch': '\n'.join(hunks), 'existing_comments': [], 'line_mapping': {}}
+        max_chars = len(hunks[0]) + 1 + len(hunks[1])
+
+        windows = [window['patch'] for window in split_file_for_review(file, max_chars)]
+        self.assertEqual(windows, [hunks[0] + '\n' + hunks[1], hunks[2]])
+
+        # One character less and the first two hunks no longer fit together
+        windows = [window['patch'] for window in split_file_for_review(file, max_chars - 1)]
+        self.assertEqual(windows, hunks)
+
+class TestPostReviewResults(unittest.TestCase):
+    def setUp(self):
+        self.pr = Mock()
+        self.comments = [
+            CodeReviewComment(path="test.py", line=2, body="✅ Test comment"),
+            CodeReviewComment(path="other.py", line=5, body="🔒 Other comment"),
+        ]
+
+    def test_comments_posted_as_one_review(self):
+        post_review_results(self.pr, "commit", self.comments, [7])
+
+        self.pr.get_review_comment.assert_called_once_with(7)
+        self.pr.create_review.assert_called_once()
+        self.assertTrue(self.pr.create_review.call_args.kwargs['body'])
+        self.assertEqual(len(self.pr.create_review.call_args.kwargs['comments']), 2)
+        self.pr.create_review_comment.assert_not_called()
+
+    def test_rejected_review_falls_back_to_single_comments(self):
+        self.pr.create_review.side_effect = GithubException(422, {"message": "Unprocessable Entity"})
+
+        post_review_results(self.pr, "commit", self.comments, [])
+
+        self.assertEqual(self.pr.create_review_comment.call_count, 2)
+
+    def test_failed_review_is_not_posted_again(self):
+        # A timeout or server error doesn't tell whether the review was created
+        self.pr.create_review.side_effect = GithubException(502, {"message": "Bad Gateway"})
+
+        post_review_results(self.pr, "commit", self.comments, [])
+
+        self.pr.create_review_comment.assert_not_called()
+
+class TestGetReviewConcurrency(unittest.TestCase):
+    def test_invalid_values_fall_back(self):
+        for value, expected in [("", 8), ("4", 4), ("many", 8), ("0", 1), ("-3", 1)]:
+            with patch.dict(os.environ, {'INPUT_REVIEW_CONCURRENCY': value}):
+                self.assertEqual(get_review_concurrency(), expected)
+
+class TestGenerateReviewSummary(unittest.TestCase):
+    @patch('cori_ai.review.LLMClient')
+    def test_summaries_sent_as_one_batch(self, mock_llm_client):
+        mock_llm = mock_llm_client.return_value.get_client.return_value
+        mock_llm.batch.return_value = [MagicMock(content="PR analysis"), MagicMock(content="Review notes")]
+
+        summary = generate_review_summary(
+            [CodeReviewComment(path="test.py", line=2, body="✅ Test comment")],
+            {'title': "Test title"},
+            [{'file': 'test.py', 'patch': '@@ -1 +1 @@\n+x'}]
+        )
+
+        mock_llm.batch.assert_called_once()
+        self.assertEqual(len(mock_llm.batch.call_args[0][0]), 2)
+        mock_llm.invoke.assert_not_called()
+        self.assertIn("PR analysis", summary)
+        self.assertIn("Review notes", summary)
+
+    @patch('cori_ai.review.LLMClient')
+    def test_no_comments_skips_review_summary(self, mock_llm_client):
+        mock_llm = mock_llm_client.return_value.get_client.return_value
+        mock_llm.batch.return_value = [MagicMock(content="PR analysis")]
+
+        summary = generate_review_summary([], {}, [])
+
+        self.assertEqual(len(mock_llm.batch.call_args[0][0]), 1)
+        self.assertIn("No review comments", summary)
+
+class TestLLMClient(unittest.TestCase):
+    def setUp(self):
+        LLMClient().reset_client()
+
+    def tearDown(self):
+        LLMClient().reset_client()
+
+    @patch('cori_ai.llm_client.load_chat_model_class')
+    def test_get_client_reuses_model_per_settings(self, mock_load_chat_model_class):
+        mock_chat_openai = mock_load_chat_model_class.return_value
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai', 'INPUT_MODEL': 'gpt-4o-mini'}):
+            first = LLMClient().get_client()
+            self.assertIs(LLMClient().get_client(), first)
+        self.assertEqual(mock_chat_openai.call_count, 1)
+
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai', 'INPUT_MODEL': 'gpt-4o'}):
+            LLMClient().get_client()
+        self.assertEqual(mock_chat_openai.call_count, 2)
+        # Both models share one connection pool per client kind
+        first_kwargs, second_kwargs = (call.kwargs for call in mock_chat_openai.call_args_list)
+        self.assertIs(first_kwargs['http_client'], second_kwargs['http_client'])
+        self.assertIs(first_kwargs['http_async_client'], second_kwargs['http_async_client'])
+
+    @patch('cori_ai.llm_client.load_chat_model_class')
+    def test_providers_share_http_clients(self, mock_load_chat_model_class):
+        for provider in ('openai', 'groq'):
+            with patch.dict('os.environ', {'INPUT_PROVIDER': provider}):
+                LLMClient().get_client()
+        openai_kwargs, groq_kwargs = (call.kwargs for call in mock_load_chat_model_class.return_value.call_args_list)
+        self.assertIs(groq_kwargs['http_client'], openai_kwargs['http_client'])
+        self.assertIs(groq_kwargs['http_async_client'], openai_kwargs['http_async_client'])
+
+    @patch('cori_ai.llm_client.load_chat_model_class')
+    def test_async_http_client_is_closed_with_its_event_loop(self, mock_load_chat_model_class):
+        mock_chat_openai = mock_load_chat_model_class.return_value
+        mock_chat_openai.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        async def use_client():
+            client = LLMClient().get_client()
+            await LLMClient.aclose_http_async_client()
+            return client
+
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai', 'INPUT_MODEL': 'gpt-4o-mini'}):
+            first = asyncio.run(use_client())
+            second = asyncio.run(use_client())
+        self.assertTrue(first.http_async_client.is_closed)
+        self.assertIsNot(second, first)
+        self.assertIsNot(second.http_async_client, first.http_async_client)
+        # The sync pool isn't bound to a loop, so it stays shared
+        self.assertIs(second.http_client, first.http_client)
+
+    @patch('cori_ai.llm_client.load_chat_model_class')
+    def test_concurrent_first_use_builds_one_model(self, mock_load_chat_model_class):
+        mock_chat_openai = mock_load_chat_model_class.return_value
+        mock_chat_openai.side_effect = lambda **kwargs: time.sleep(0.01) or Mock()
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai', 'INPUT_MODEL': 'gpt-4o-mini'}):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                clients = list(executor.map(lambda _: LLMClient().get_client(), range(8)))
+        self.assertEqual(mock_chat_openai.call_count, 1)
+        self.assertTrue(all(client is clients[0] for client in clients))
+
+    @patch('cori_ai.llm_client.LLMClient._get_http_client')
+    def test_prewarm_opens_connections_to_provider(self, mock_get_http_client):
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai', 'INPUT_OPENAI_BASE_URL': 'https://llm.example.com/v1'}):
+            LLMClient().prewarm(3)
+        self.assertEqual(mock_get_http_client.return_value.head.call_count, 3)
+        self.assertEqual(mock_get_http_client.return_value.head.call_args[0][0], 'https://llm.example.com/v1')
+
+        mock_get_http_client.reset_mock()
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai'}), patch('cori_ai.llm_client.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as mock_executor:
+            LLMClient().prewarm(1000)
+        self.assertEqual(mock_executor.call_args.kwargs['max_workers'], HTTP_LIMITS.max_connections)
+
+        mock_get_http_client.reset_mock()
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'mistral'}):
+            LLMClient().prewarm(3)
+        mock_get_http_client.assert_not_called()
+
+    @patch('cori_ai.llm_client.load_chat_model_class')
+    def test_fast_tier_uses_fast_model(self, mock_load_chat_model_class):
+        mock_chat_openai = mock_load_chat_model_class.return_value
+        mock_chat_openai.side_effect = lambda **kwargs: Mock()
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai', 'INPUT_MODEL': 'gpt-4o', 'INPUT_FAST_MODEL': 'gpt-4o-mini'}):
+            self.assertIsNot(LLMClient().get_client('fast'), LLMClient().get_client())
+            self.assertEqual(LLMClient().get_model('fast'), 'gpt-4o-mini')
+        self.assertEqual([call.kwargs['model_name'] for call in mock_chat_openai.call_args_list], ['gpt-4o-mini', 'gpt-4o'])
+
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'openai', 'INPUT_MODEL': 'gpt-4o', 'INPUT_FAST_MODEL': ''}):
+            self.assertEqual(LLMClient().get_model('fast'), 'gpt-4o')
+
+    def test_unknown_provider_warns_once(self):
+        resolve_provider.cache_clear()
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'acme', 'INPUT_MODEL': ''}), self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(LLMClient().get_cache_key_parts()[:2], ('openai', 'gpt-4o-mini'))
+            LLMClient().get_model('fast')
+        self.assertEqual(len(logs.records), 1)
+
+    def test_cache_key_parts_include_base_url(self):
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'ollama', 'INPUT_MODEL': 'codellama:7b', 'INPUT_OLLAMA_BASE_URL': 'http://gpu-a:11434'}):
+            first = LLMClient().get_cache_key_parts()
+        with patch.dict('os.environ', {'INPUT_PROVIDER': 'ollama', 'INPUT_MODEL': 'codellama:7b', 'INPUT_OLLAMA_BASE_URL': 'http://gpu-b:11434'}):
+            second = LLMClient().get_cache_key_parts()
+        self.assertEqual(first, ('ollama', 'codellama:7b', 'http://gpu-a:11434'))
+        self.assertNotEqual(first, second)
+
+    def test_get_token_limit_uses_longest_prefix(self):
+        self.assertEqual(get_token_limit('gpt-4o-mini'), 128000)
+        self.assertEqual(get_token_limit('gpt-4'), 8192)
+        self.assertEqual(get_token_limit('unknown-model'), 8192)
+
+class TestPruneCache(unittest.TestCase):
+    def test_old_and_excess_entries_are_removed(self):
+        with tempfile.TemporaryDirectory() as root, patch('cori_ai.cache.CACHE_DIR', Path(root)):
+            for i, age in enumerate([0, 10, 20, 100]):
+                set_cached('review', f'key{i}', 'value')
+                os.utime(Path(root) / 'review' / f'key{i}', (time.time() - age, time.time() - age))
+
+            prune_cache('review', max_age=50, max_entries=2)
+
+            self.assertEqual(sorted(os.listdir(Path(root) / 'review')), ['key0', 'key1'])
+
+class TestFitToTokenBudget(unittest.TestCase):
+    def test_sections_within_budget_are_unchanged(self):
+        sections = ['a' * 40, 'b' * 400]
+        self.assertEqual(fit_to_token_budget(sections, 200), sections)
+
+    def test_largest_section_is_truncated_first(self):
+        small, large = fit_to_token_budget(['a' * 40, 'b' * 4000], 510)
+        self.assertEqual(small, 'a' * 40)
+        self.assertTrue(large.startswith('b' * 2000))
+        self.assertTrue(large.endswith('...[truncated]'))
+        self.assertLess(len(large), 2100)
+
+    def test_sections_are_compressed_before_truncating(self):
+        readme = '# Title\n\n![badge](https://img.shields.io/x)\n<!-- note -->\n\n\n\nBody   \n'
+        self.assertEqual(compress_text(readme), '# Title\n\nBody\n')
+        self.assertEqual(fit_to_token_budget([readme], 5), ['# Title\n\nBody\n'])
+
+class TestReadTextFile(unittest.TestCase):
+    def test_large_files_are_truncated(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.md') as f:
+            f.write(b'# Title\n' + b'x' * 100)
+            f.flush()
+            self.assertEqual(read_text_file(f.name, max_bytes=200), '# Title\n' + 'x' * 100)
+            self.assertEqual(read_text_file(f.name, max_bytes=8), '# Title\n\n...[truncated]')
+
+class TestIndexCodebase(unittest.TestCase):
+    def test_nested_dependency_dirs_are_pruned(self):
+        with tempfile.TemporaryDirectory() as root:
+            for rel_path in ['app/main.py', 'packages/web/node_modules/dep/index.js', 'node_modules/x.js', 'README.md']:
+                path = os.path.join(root, rel_path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'w').close()
+
+            index = index_codebase(root)
+
+            self.assertEqual(index['source'], [os.path.join('app', 'main.py')])
+            self.assertEqual(index['documentation'], ['README.md'])
+
+class TestGetFileType(unittest.TestCase):
+    def test_compound_test_suffixes(self):
+        self.assertEqual(get_file_type('src/app.test.ts'), 'test')
+        self.assertEqual(get_file_type('pkg/server_test.go'), 'test')
+        self.assertEqual(get_file_type('src/app.ts'), 'source')
+        self.assertEqual(get_file_type('docs/README.MD'), 'documentation')
+        self.assertIsNone(get_file_type('Makefile'))
+
+class TestAnalyzeProjectStructure(unittest.TestCase):
+    @patch('cori_ai.indexer.LLMClient')
+    def test_key_files_sent_to_async_llm_call(self, mock_llm_client):
+        mock_llm_client.return_value.get_token_limit.return_value = 128000
+        llm = mock_llm_client.return_value.get_client.return_value
+        llm.ainvoke = AsyncMock(return_value=Mock(content="analysis"))
+
+        with tempfile.TemporaryDirectory() as root, patch('cori_ai.cache.CACHE_DIR', Path(root) / 'cache'):
+            with open(os.path.join(root, 'README.md'), 'w') as f:
+                f.write('# Project readme')
+
+            result = asyncio.run(analyze_project_structure({'source': ['main.py']}, root))
+
+        self.assertEqual(result, "analysis")
+        messages = llm.ainvoke.call_args[0][0]
+        self.assertIn('# Project readme', messages[-1].content)
+        self.assertIn('- main.py', messages[-1].content)
+        llm.invoke.assert_not_called()
+
+    @patch('cori_ai.indexer.INDEX_SUMMARY_MAX_FILES', 2)
+    @patch('cori_ai.indexer.LLMClient')
+    def test_long_file_lists_are_capped(self, mock_llm_client):
+        mock_llm_client.return_value.get_token_limit.return_value = 128000
+        llm = mock_llm_client.return_value.get_client.return_value
+        llm.ainvoke = AsyncMock(return_value=Mock(content="analysis"))
+
+        with tempfile.TemporaryDirectory() as root, patch('cori_ai.cache.CACHE_DIR', Path(root) / 'cache'):
+            asyncio.run(analyze_project_structure({'source': ['c.py', 'a.py', 'd.py', 'b.py']}, root))
+
+        content = llm.ainvoke.call_args[0][0][-1].content
+        self.assertIn('- a.py\n- b.py\n- ... and 2 more', content)
+        self.assertNotIn('c.py', content)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file